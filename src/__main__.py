@@ -1,3 +1,5 @@
 import builder.launchgui
 
-builder.launchgui.main()
+# Guarded so processes spawned for parallel building don't launch the gui
+if __name__ == '__main__':
+	builder.launchgui.main()
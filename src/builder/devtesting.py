@@ -5,10 +5,17 @@ This file holds constants and functions meant for
 development.
 '''
 
-from typing import List
+from pathlib import Path
+from typing import Dict, List, Tuple
+import csv
+import random
+import tempfile
+
 import builder.proc_constraints as proc
 import builder.io_file as io_file
 import builder.models as models
+import builder.proc_npbackend as npbackend
+import builder.proc_varindex as varindex
 
 
 
@@ -40,3 +47,219 @@ def dummyProjectState() -> models.ProjectState:
 
 
 
+
+#
+# Build Path Checks
+#
+
+def checkBuildPaths (varData: models.VarsData, numSetups: int = 100, numMoves: int = 10, seed: int = 0) -> List[str]:
+	'''
+	Builds random setups every way the constraint builder can, and checks that
+	they all agree. Returns a description of every mismatch, so an empty list
+	means everything matched.
+
+	 - Selecting variables: the dense product walk, bitsets and NumPy
+	 - Splitting: python and NumPy bucketing, and whatever a normal build picks
+	 - Tag moves: patching a cached build with applyTagMove, against building
+		the changed setup from scratch
+
+	Everything is compared against the dense python path, which is the slowest, so
+	stick to small variable tables (like the sample data). NumPy gets used no matter
+	how few variables there are, as long as it's installed.
+	'''
+	rng = random.Random(seed)
+	problems: List[str] = []
+
+	for setupInd in range(numSetups):
+		setup = _randomSetup(varData, rng)
+
+		for sideName, selTags in [('left', setup.selLeftTags), ('right', setup.selRightTags)]:
+			selections = _selectEveryWay(selTags, varData)
+			for pathName, selected in selections.items():
+				if selected != selections['dense']:
+					problems.append(f'Setup {setupInd}: {pathName} selection on the {sideName} differs from the dense one')
+
+		expected = _rebuildSplits(setup, varData)
+		if proc._splitSelectedTuples(setup, varData) != expected:
+			problems.append(f'Setup {setupInd}: built splits differ from the dense rebuild')
+
+		if npbackend.isAvailable() and not proc._hasRepeatedTags(setup):
+			splitInds = proc._getSplitInds(setup, varData)
+			tagPositions = proc._getSplitTagPositions(setup, varData, splitInds)
+			if proc._orderSplits(proc._bucketWithNumpy(setup, varData, splitInds), tagPositions) != expected:
+				problems.append(f'Setup {setupInd}: NumPy splits differ from the dense rebuild')
+
+		# Moves patch the build cached just above
+		for moveInd in range(numMoves):
+			move = _randomMove(setup, varData, rng)
+			proc.applyTagMove(setup, varData, move)
+
+			if proc._splitSelectedTuples(setup, varData) != _rebuildSplits(setup, varData):
+				problems.append(f'Setup {setupInd}, move {moveInd} ({move}): patched splits differ from the dense rebuild')
+
+	return problems
+
+
+def _selectEveryWay (selTags: Dict[str, List[str]], varData: models.VarsData) -> Dict[str, List[Tuple[str, ...]]]:
+	'''
+	The variables selected by selTags, from every selection path which handles them
+	'''
+	selections = {'dense': proc._findSelectedTuples(selTags, varData, sparse=False)}
+
+	# Only the dense walk repeats variables for a repeated tag, the others never get used then
+	if any([len(set(sel)) != len(sel) for sel in selTags.values()]):
+		return selections
+
+	selections['bitset'] = proc._findSelectedTuples(selTags, varData, sparse=True)
+
+	if npbackend.isAvailable():
+		index = varindex.getVarIndex(varData)
+		varIds = npbackend.findSelectedIds(index, proc._getSelCodes(selTags, varData))
+		selections['numpy'] = [index.varTuples[varId] for varId in varIds.tolist()]
+
+	return selections
+
+
+def _rebuildSplits (setup: models.SetupConstraintGroup, varData: models.VarsData) -> List[Tuple[Tuple[str, ...], List[Tuple[str, ...]], List[Tuple[str, ...]]]]:
+	'''
+	Splits of the setup from scratch, using the dense python path and skipping the cache
+	'''
+	splitInds = proc._getSplitInds(setup, varData)
+	tagPositions = proc._getSplitTagPositions(setup, varData, splitInds)
+
+	return proc._orderSplits(proc._bucketWithPython(setup, varData, splitInds, sparse=False), tagPositions)
+
+
+def _randomSetup (varData: models.VarsData, rng: random.Random) -> models.SetupConstraintGroup:
+	'''
+	A setup selecting random tags on each side, now and then with a tag selected twice
+	'''
+	setup = models.SetupConstraintGroup.createEmptySetup(varData)
+
+	for selTags in [setup.selLeftTags, setup.selRightTags]:
+		for tagGroup in varData.tag_order:
+			members = varData.tag_members[tagGroup]
+			selTags[tagGroup] = rng.sample(members, rng.randint(0, len(members)))
+
+			if len(selTags[tagGroup]) > 0 and rng.random() < 0.1:
+				selTags[tagGroup].append(rng.choice(selTags[tagGroup]))
+
+	setup.splitBy = [tagGroup for tagGroup in varData.tag_order if rng.random() < 0.5]
+
+	return setup
+
+
+def _randomMove (setup: models.SetupConstraintGroup, varData: models.VarsData, rng: random.Random) -> models.TagMove:
+	'''
+	Selects or unselects a random tag
+	'''
+	onLeft = rng.random() < 0.5
+	tagGroup = rng.choice(varData.tag_order)
+
+	selected = (setup.selLeftTags if onLeft else setup.selRightTags)[tagGroup]
+	unselected = [tag for tag in varData.tag_members[tagGroup] if tag not in selected]
+	added = len(selected) == 0 or (len(unselected) > 0 and rng.random() < 0.5)
+
+	return models.TagMove(
+		tagGroup=tagGroup,
+		tag=rng.choice(unselected if added else selected),
+		onLeft=onLeft,
+		added=added
+	)
+
+
+
+def checkSparseExports (varData: models.VarsData, numSetups: int = 20, seed: int = 0) -> List[str]:
+	'''
+	Exports random setups in every sparse format (long .csv, MPS, LP and .dat), and
+	checks that none of them list a 0 coefficient in their constraints. Random setups
+	select lots of variables on both sides, so plenty of coefficients cancel out.
+	Returns a description of every 0 found, so an empty list means none were.
+	'''
+	rng = random.Random(seed)
+	projState = models.ProjectState(
+		varData=varData,
+		setupList=[_randomSetup(varData, rng) for _ in range(numSetups)]
+	)
+
+	# Everything gets an objective coefficient, so those aren't mixed up with constraints
+	objCoefs = {name: 1.0 for name in varindex.getVarIndex(varData).exportNames}
+
+	problems: List[str] = []
+	with tempfile.TemporaryDirectory() as tempDir:
+		for fileFormat, findCoefs in [('longcsv', _findLongCSVCoefs), ('mps', _findMPSCoefs), ('lp', _findLPCoefs), ('dat', _findDATCoefs)]:
+			filepath = str(Path(tempDir) / ('export' + io_file.EXPORT_FORMATS[fileFormat]))
+			io_file.exportToFile(filepath, projState, fileFormat, objCoefs)
+
+			with open(filepath, 'r', newline='') as exportFile:
+				for lineNum, coef in findCoefs(exportFile):
+					if float(coef) == 0:
+						problems.append(f'{fileFormat}: 0 coefficient ({coef}) on line {lineNum}')
+
+	return problems
+
+
+# Each of these yields (line number, coefficient text) for every constraint
+# coefficient in an exported file
+
+def _findLongCSVCoefs (exportFile):
+	reader = csv.reader(exportFile)
+	next(reader, None) # Header
+	for row in reader:
+		yield reader.line_num, row[2]
+
+
+def _findMPSCoefs (exportFile):
+	inColumns = False
+	for lineNum, line in enumerate(exportFile, start=1):
+		if not line.startswith(' '):
+			inColumns = line.strip() == 'COLUMNS'
+			continue
+
+		fields = line.split()
+		if inColumns:
+			# Column name, then (row, coefficient) pairs
+			for rowName, coef in zip(fields[1::2], fields[2::2]):
+				if rowName != io_file.OBJ_ROW_NAME:
+					yield lineNum, coef
+
+
+def _findLPCoefs (exportFile):
+	inConstraints = False
+	for lineNum, line in enumerate(exportFile, start=1):
+		if not line.startswith(' '):
+			inConstraints = line.strip() == 'Subject To'
+			continue
+
+		# Terms are written as "+ 2.0 var" or "- 2.0 var"
+		tokens = line.split()
+		if inConstraints:
+			for ind in range(len(tokens) - 1):
+				if tokens[ind] in ['+', '-']:
+					yield lineNum, tokens[ind + 1]
+
+
+def _findDATCoefs (exportFile):
+	inA = False
+	for lineNum, line in enumerate(exportFile, start=1):
+		line = line.strip()
+		if line == 'param A :=':
+			inA = True
+		elif line == ';':
+			inA = False
+		elif inA:
+			# Constraint, variable, coefficient
+			yield lineNum, line.split()[-1]
+
+
+
+
+if __name__ == '__main__':
+	projState = dummyProjectState()
+
+	problems = checkBuildPaths(projState.varData) + checkSparseExports(projState.varData)
+	for problem in problems:
+		print(f"[[ !! Mismatch ]] {problem}")
+
+	if len(problems) == 0:
+		print(":D Every build path agrees, and no sparse export has a 0 coefficient")
@@ -10,4 +10,10 @@ WIDTH_BIG = 35
 
 CSV_FILES = [('CSV Files', '*.csv'), ('All Files', '*.*')]
 PROJ_FILES = [('Project Files', '*.cproj'), ('All Files', '*.*')]
+MPS_FILES = [('MPS Files', '*.mps'), ('All Files', '*.*')]
+LP_FILES = [('LP Files', '*.lp'), ('All Files', '*.*')]
+DAT_FILES = [('Data Files', '*.dat'), ('All Files', '*.*')]
+
+# Exports are compressed when saved with one of these extensions (eg: .csv.gz)
+COMPRESSED_FILES = [('Gzip Compressed', '*.gz'), ('XZ Compressed', '*.xz')]
 
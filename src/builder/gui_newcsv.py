@@ -18,6 +18,7 @@ from enum import Enum, auto
 
 import builder.models as models
 import builder.proc_constraints as proc
+import builder.proc_ingest as ingest
 import builder.proc_linting as lint
 import builder.proc_render as render
 import builder.io_file as io_file
@@ -25,6 +26,9 @@ import builder.gui_projectoverview as gui_projectoverview
 from builder.devtesting import dummyProjectState
 from builder.gui_consts import CSV_FILES, WIDTH_BIG, WIDTH_MED, WIDTH_SML
 
+# How often the parse is checked on (ms)
+PARSE_POLL_MS = 100
+
 
 class ChangeOptions:
 	ADDED = auto()
@@ -53,9 +57,12 @@ class GUINewCSV:
 	_errWithNamesList: str = None
 	_objSampleVar: str = None
 
-	_varNamesRaw: List[str] = None
+	_objSample: List[str] = None # A few variables from the file, for previewing
 	_tagLists: List[List[str]] = None
 
+	# Reading the whole file, started by Preview Changes
+	_parseJob: ingest.IngestJob = None
+
 	_oldVarNames: List[List[str]] = None
 	_oldTagOrder: List[str] = None
 	_oldTagDict: Dict[str, List[str]] = None
@@ -116,11 +123,12 @@ class GUINewCSV:
 		self.lbl_import_samplevar = ttk.Label(self.lblfrm_import)
 		self.lbl_import_samplevar.configure(text="Select a file")
 		self.lbl_import_samplevar.grid(column=1, padx=10, row=2, sticky="w")
-		__values = ["_", "-", "="]
+		__values = list(lint.VALID_DELIMITERS)
 		__tkvar = tk.StringVar()
 		self.opt_import_delim = tk.OptionMenu(
 			self.lblfrm_import, __tkvar, *__values, command=self.onopt_import_delim
 		)
+		self.var_import_delim = __tkvar
 		self.opt_import_delim.grid(column=1, padx=10, row=1, sticky="w")
 		self.lbl_import_path = ttk.Label(self.lblfrm_import)
 		self.lbl_import_path.configure(anchor="w", text="Select a file")
@@ -281,6 +289,8 @@ class GUINewCSV:
 		if newpath != None:
 			self._objFileStr = newpath
 		
+		self._update_readsample()
+		self._update_guessdelim()
 		self._update_processfile()
 		self._redraw_dynamics()
 
@@ -298,14 +308,22 @@ class GUINewCSV:
 		self._redraw_dynamics()
 
 	def onbtn_naming_preview(self):
-		self._update_previewchanges()
-		self._redraw_dynamics()
+		self._update_startparse()
 
 	def onbtn_bot_apply(self):
 		print("Applying changes")
-		newVarsData: models.VarsData = proc.buildVarDataObject(
-			self._varNamesRaw,
-			self._delimiter,
+
+		# Nothing to build the variables from
+		job = self._parseJob
+		if job == None or not job.isDone() or job.parsed == None:
+			print("[[ !! Warning ]] The objective file hasn't been read, not applying")
+			if job != None and job.errMsg != None:
+				self._errWithObjFile = job.errMsg
+			self._redraw_dynamics()
+			return
+
+		newVarsData: models.VarsData = ingest.buildVarData(
+			self._parseJob.parsed,
 			self._groupnameList
 		)
 		self._passedProjectState = proc.changeVarsData(newVarsData, self._passedProjectState)
@@ -327,6 +345,7 @@ class GUINewCSV:
 
 	# Update calls
 	def _update_init(self):
+		self._update_readsample()
 		self._update_processfile()
 		self._update_groupnaming()
 
@@ -347,7 +366,7 @@ class GUINewCSV:
 				continue
 
 			old_mems = set(self._oldTagDict[taggroupname])
-			new_mems = set(self._tagLists[ind])
+			new_mems = set(self._parseJob.parsed.tagLists()[ind])
 
 			self._changesTag[taggroupname] = {
 				DifferenceOptions.ADDED: list(new_mems - old_mems),
@@ -358,7 +377,7 @@ class GUINewCSV:
 		old_varnames_raw = set([
 			self._delimiter.join(x) for x in self._oldVarNames
 		])
-		new_names_set = set(self._varNamesRaw)
+		new_names_set = set(self._parseJob.parsed.iterNames())
 
 		self._changesVars[DifferenceOptions.ADDED] = list(new_names_set - old_varnames_raw)
 		self._changesVars[DifferenceOptions.REMOVED] = list(old_varnames_raw - new_names_set)
@@ -367,32 +386,66 @@ class GUINewCSV:
 		self._previewReady = True
 
 
+	def _update_readsample(self):
+		# Everything before Preview Changes only looks at a sample of the variables
+		self._objSample = None
+		self._objSampleVar = None
+
+		if self._objFileStr == None:
+			return
+		# TODO: What if its a bad file ???
+		self._objSample = io_file.readVarnamesSample(self._objFileStr, spread=True)
+		if len(self._objSample) != 0:
+			self._objSampleVar = self._objSample[0]
+
+
+	def _update_guessdelim(self):
+		# Pre-selects the separator that fits the sample best
+		if self._objSample == None:
+			return
+
+		guessedDelim = lint.guessDelimiter(self._objSample)
+		if guessedDelim != None:
+			self._delimiter = guessedDelim
+			self.var_import_delim.set(guessedDelim)
+
+
 	def _update_processfile(self):
 		self._previewReady = False
 
-		self._varNamesRaw = None
 		self._errWithObjFile = None
 		self._tagLists = None
 
 		if  self._objFileStr == None:
 			self._errWithObjFile = "No file selected"
 			return
-		# TODO: What if its a bad file ???
-		self._varNamesRaw = io_file.readVarnamesRaw(self._objFileStr)
-		self._objSampleVar = self._varNamesRaw[0]
 
 		if self._delimiter == None:
 			self._errWithObjFile = "No delimiter selected"
 			return
-		self._errWithObjFile = lint.lintAllVarNamesRaw(self._varNamesRaw, self._delimiter)
+		self._errWithObjFile = lint.lintAllVarNamesRaw(self._objSample, self._delimiter)
 
 		if self._errWithObjFile:
 			return
-		self._tagLists = proc.makeTagGroupMembersList(self._varNamesRaw, self._delimiter)
+		self._tagLists = proc.makeTagGroupMembersList(self._objSample, self._delimiter)
 
 		self._redraw_rebuild_naming_frame()
 
 
+	def _update_startparse(self):
+		job = self._parseJob
+		if job != None and job.objCSVPath == self._objFileStr and job.delim == self._delimiter:
+			# Already read (or being read)
+			if job.isDone():
+				self._redraw_parse_progress()
+			return
+
+		self._parseJob = ingest.IngestJob(self._objFileStr, self._delimiter)
+		self._parseJob.start()
+
+		self._redraw_parse_progress()
+
+
 	def _update_groupnaming(self):
 		self._previewReady = False
 
@@ -593,6 +646,26 @@ class GUINewCSV:
 		self.btn_bot_apply['style'] = ''
 
 
+	def _redraw_parse_progress(self):
+		job = self._parseJob
+
+		# The file or separator was changed while it was being read
+		if job.objCSVPath != self._objFileStr or job.delim != self._delimiter:
+			return
+
+		if not job.isDone():
+			self.btn_import_preview['state'] = 'disabled'
+			self.lbl_changes_group.configure(text="Reading all variables...")
+			self._passedRoot.after(PARSE_POLL_MS, self._redraw_parse_progress)
+			return
+
+		if job.errMsg != None:
+			self._errWithObjFile = job.errMsg
+		else:
+			self._update_previewchanges()
+		self._redraw_dynamics()
+
+
 	def _redraw_rebuild_naming_frame(self):
 		# destroy the naming frame
 		for c in self.frm_naming_prompts.winfo_children():
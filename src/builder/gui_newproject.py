@@ -13,6 +13,7 @@ from tkinter import ttk
 from typing import List
 
 import builder.proc_constraints as proc
+import builder.proc_ingest as ingest
 import builder.gui_projectoverview as gui_projectoverview
 import builder.io_file as io_file
 import builder.proc_linting as lint
@@ -47,9 +48,15 @@ _groupnameList: List[str] = None
 _delimiter: str = None
 
 # useful processed values
-_varNamesRaw: List[str] = None
+_objSample: List[str] = None # A few variables from the file, for previewing
 _tagLists: List[List[str]] = None
 
+# Reading the whole file, started by Continue
+_parseJob: ingest.IngestJob = None
+
+# How often the parse is checked on (ms)
+PARSE_POLL_MS = 100
+
 _passedRoot: tk.Tk = None
 _passedProjectState: models.ProjectState = None
 
@@ -70,6 +77,8 @@ def updateNewObjFile() -> None:
 	if newPath != None:
 		_objFileStr = newPath
 
+	processReadSample()
+	processGuessDelim()
 	processParseFile()
 	updateGroupName()
 	multiRedrawFileUpdate()
@@ -100,30 +109,68 @@ def updateGroupName() -> None:
 # Processing Calls
 #
 
-def processParseFile() -> None:
-	global _varNamesRaw, _objSampleVar, _errWithObjFile, _tagLists
+def processReadSample() -> None:
+	'''
+		Reads a sample of the file's variables, which everything on this
+		screen is previewed from. The whole file is only read on Continue.
+	'''
+	global _objSample, _objSampleVar
 
-	# TODO: Remember what old me meant with the comment below
-	# TODO: This processing call really should be a single thing no?
-	_varNamesRaw = None
+	_objSample = None
 	_objSampleVar = None
-	_errWithObjFile = None
-	_tagLists = None
 
 	if _objFileStr == None:
 		return
-	
+
 	# TODO: Lint file name (in processing module)
-	_varNamesRaw = io_file.readVarnamesRaw(Path(_objFileStr))
-	_objSampleVar = _varNamesRaw[0]
+	_objSample = io_file.readVarnamesSample(Path(_objFileStr), spread=True)
+	if len(_objSample) != 0:
+		_objSampleVar = _objSample[0]
+
+
+def processGuessDelim() -> None:
+	'''
+		Picks the separator that fits the sample best, so it usually doesn't need picking
+	'''
+	global _delimiter
+
+	if _objSample == None:
+		return
+
+	guessedDelim = lint.guessDelimiter(_objSample)
+	if guessedDelim != None:
+		_delimiter = guessedDelim
+		_cbbDelimSelector.set(guessedDelim)
+
+
+def processParseFile() -> None:
+	global _errWithObjFile, _tagLists
+
+	_errWithObjFile = None
+	_tagLists = None
 
-	if _delimiter == None:
+	if _objSample == None or _delimiter == None:
 		return
-	_errWithObjFile = lint.lintAllVarNamesRaw(_varNamesRaw, _delimiter)
+	_errWithObjFile = lint.lintAllVarNamesRaw(_objSample, _delimiter)
 
 	if _errWithObjFile:
 		return
-	_tagLists = proc.makeTagGroupMembersList(_varNamesRaw, _delimiter)
+	_tagLists = proc.makeTagGroupMembersList(_objSample, _delimiter)
+
+
+def processStartFullParse() -> None:
+	'''
+		Reads the whole file in the background, see redrawParseProgress
+	'''
+	global _parseJob
+
+	if _parseJob != None and not _parseJob.isDone():
+		return
+
+	_parseJob = ingest.IngestJob(Path(_objFileStr), _delimiter)
+	_parseJob.start()
+
+	redrawParseProgress()
 
 
 
@@ -132,10 +179,18 @@ def processParseFile() -> None:
 #
 
 def transitionToOverview() -> None:
-	global _passedRoot, _passedProjectState
+	global _passedRoot, _passedProjectState, _errWithObjFile
+
+	# Nothing to build the variables from
+	if _parseJob == None or not _parseJob.isDone() or _parseJob.parsed == None:
+		print("[[ !! Warning ]] The objective file hasn't been read, not continuing")
+		if _parseJob != None and _parseJob.errMsg != None:
+			_errWithObjFile = _parseJob.errMsg
+		multiRedrawFileUpdate()
+		return
 
 	# Write Data
-	_passedProjectState.varData = proc.buildVarDataObject(_varNamesRaw, _delimiter, _groupnameList)
+	_passedProjectState.varData = ingest.buildVarData(_parseJob.parsed, _groupnameList)
 	_passedProjectState.setupList = []
 
 	# Clear Root
@@ -203,7 +258,7 @@ def redrawNamingFrame(tagLists: List[List[str]]) -> None:
 		child.destroy()
 
 	if _errWithObjFile:
-		lblMessage = tk.Label(_frmNameGroups, text=_errWithObjFile, anchor="center")
+		lblMessage = tk.Label(_frmNameGroups, text=_errWithObjFile, anchor="center", justify="left", wraplength=500)
 		lblMessage.grid(row=0, column=0, columnspan=2, sticky="nsew")
 	elif tagLists == None:
 		lblMessage = tk.Label(_frmNameGroups, text="Select a file", anchor="center")
@@ -234,6 +289,31 @@ def redrawNamingFrame(tagLists: List[List[str]]) -> None:
 			lblExampleMems.grid(row=ind+1, column=1, padx=5, pady=5, sticky="nsw")
 
 
+def redrawParseProgress() -> None:
+	'''
+		Waits on the full parse, then either moves on or shows what's wrong with the file
+	'''
+	global _errWithObjFile
+
+	if not _parseJob.isDone():
+		_lblVerifyNames['text'] = 'Reading all variables...'
+		_btnNextStage['state'] = 'disabled'
+		_passedRoot.after(PARSE_POLL_MS, redrawParseProgress)
+		return
+
+	# The file or separator was changed while it was being read
+	if _parseJob.objCSVPath != Path(_objFileStr) or _parseJob.delim != _delimiter:
+		redrawNamingStatus(_groupnameList)
+		return
+
+	if _parseJob.errMsg != None:
+		_errWithObjFile = _parseJob.errMsg
+		multiRedrawFileUpdate()
+		return
+
+	transitionToOverview()
+
+
 def redrawNamingStatus(inputNames: List[str]) -> None:
 	global _lblVerifyNames, _errWithNamesList, _errWithObjFile
 
@@ -279,7 +359,7 @@ def buildGUI_ObjImport(root: tk.Tk, projectState: models.ProjectState):
 	frmNameAndVerify.grid(row=2, column=0, padx=10, pady=(0, 10), sticky="nsew")
 
 	# Next Step Button
-	_btnNextStage = tk.Button(root, text="Continue >", anchor="center", command=transitionToOverview)
+	_btnNextStage = tk.Button(root, text="Continue >", anchor="center", command=processStartFullParse)
 	_btnNextStage.grid(row=3, column=0, padx=10, pady=(0, 10), sticky="e")
 
 	multiRedrawFileUpdate()
@@ -305,8 +385,7 @@ def buildFileParseFrame(root: tk.Tk) -> ttk.LabelFrame:
 	_lblLoadedSampleVar.grid(row=1, column=1, sticky="nsw", padx=5, pady=5)
 
 	lblDelim = tk.Label(frmFileParseSetup, text="Separator:")
-	# TODO: Pull delimiters from program config
-	_cbbDelimSelector = ttk.Combobox(frmFileParseSetup, values=('_', '-', '='))
+	_cbbDelimSelector = ttk.Combobox(frmFileParseSetup, values=tuple(lint.VALID_DELIMITERS))
 	_cbbDelimSelector['state'] = 'readonly'
 	lblDelim.grid(row=2, column=0, sticky="nse", padx=5, pady=5)
 	_cbbDelimSelector.grid(row=2, column=1, sticky="nsw", padx=5, pady=10)
@@ -5,21 +5,31 @@ Constraint Builder Constraints Overview Screen
 import copy
 import csv
 import tkinter as tk
+import tkinter.messagebox as tkmsg
+from pathlib import Path
 from tkinter import ttk
-from typing import List
+from typing import Dict, List, Set, Tuple
 
+import builder.proc_bitset as bitset
 import builder.proc_constraints as proc
+import builder.proc_parallel as parallel
 import builder.proc_render as render
 import builder.gui_variablefiltering as gui_variablefiltering
 import builder.gui_newcsv as gui_newcsv
 import builder.models as models
 import builder.devtesting as devtesting
 import builder.io_file as io_file
+import builder.io_export as io_export
 from builder.gui_consts import *
 
 # Exposed GUI Elements
 _frmConstrsDisplay: tk.Frame = None
 _lblSummary: tk.Label = None
+_cbbShardFormat: ttk.Combobox = None
+_varShardGzip: tk.StringVar = None
+_pgbExport: ttk.Progressbar = None
+_lblExportProgress: tk.Label = None
+_btnCancelExport: tk.Button = None
 
 
 # State Variables
@@ -28,9 +38,17 @@ _constrGroupList: List[models.SetupConstraintGroup] = None
 _passedProjectState: models.ProjectState = None
 _passedRoot: tk.Tk = None
 
+# The export running in the background, if there is one
+_exportJob: io_export.ExportJob = None
+_exportPollId: str = None # The pending root.after() redrawing its progress
+
+# How often the export's progress is redrawn (ms)
+EXPORT_POLL_MS = 100
+
 # Calculated from _constrGroupList
 _constrPerGroup: List[int] = None
-_varsConstrainted: List[List[str]] = None
+_termsPerGroup: List[int] = None # Left and right side terms, before any cancel out
+_varsConstrainted: int = None # Bitset of variable ids, see proc_bitset
 
 # This will be useful for scrolling
 # https://stackoverflow.com/questions/68056757/how-to-scroll-through-tkinter-widgets-that-were-defined-inside-of-a-function
@@ -80,12 +98,105 @@ def updateSaveProject () -> None:
 def updateExportCSV () -> None:
 	print("Exporting to csv")
 
-	outputFilepathStr = io_file.getSaveAsFilepath(CSV_FILES)
+	outputFilepathStr = io_file.getSaveAsFilepath(CSV_FILES + COMPRESSED_FILES)
 	if outputFilepathStr == None:
 		return
-	io_file.writeToCSV(outputFilepathStr, _passedProjectState)
-	
-	print(":D File Written")
+	_startExportJob(outputFilepathStr, 'csv')
+
+
+def updateExportLongCSV () -> None:
+	print("Exporting to sparse csv")
+
+	outputFilepathStr = io_file.getSaveAsFilepath(CSV_FILES + COMPRESSED_FILES)
+	if outputFilepathStr == None:
+		return
+	_startExportJob(outputFilepathStr, 'longcsv')
+
+
+def updateExportSolverFile (fileFormat: str) -> None:
+	'''
+	Exports to a solver input file, fileFormat being 'mps', 'lp' or 'dat'. Objective
+	coefficients aren't stored in the project, so the objective .csv is asked for first.
+	'''
+	print(f"Exporting to {fileFormat}")
+
+	objCoefs = _askObjectiveCoefs()
+	if objCoefs == None:
+		return
+
+	fileTypes = {'mps': MPS_FILES, 'lp': LP_FILES, 'dat': DAT_FILES}
+	outputFilepathStr = io_file.getSaveAsFilepath(fileTypes[fileFormat] + COMPRESSED_FILES)
+	if outputFilepathStr == None:
+		return
+
+	_startExportJob(outputFilepathStr, fileFormat, objCoefs)
+
+
+def updateExportSharded () -> None:
+	'''
+	Exports every constraint group to its own file, in the format picked
+	in the combobox, along with a manifest
+	'''
+	fileFormat = _cbbShardFormat.get()
+	print(f"Exporting groups separately to {fileFormat}")
+
+	objCoefs = None
+	if fileFormat in ['mps', 'lp', 'dat']:
+		objCoefs = _askObjectiveCoefs()
+		if objCoefs == None:
+			return
+
+	outputDirpathStr = io_file.getDirectoryPath()
+	if outputDirpathStr == None:
+		return
+
+	compression = 'gzip' if _varShardGzip.get() == '1' else None
+	_startExportJob(outputDirpathStr, fileFormat, objCoefs, compression=compression, sharded=True)
+
+
+def updateCancelExport () -> None:
+	if _exportJob == None or _exportJob.isDone():
+		return
+	print("Cancelling export")
+
+	_exportJob.cancel()
+
+
+def _startExportJob (filepath: str, fileFormat: str, objCoefs: Dict[str, float] = None, compression: str = 'auto', sharded: bool = False) -> None:
+	'''
+	Starts exporting in the background, and starts redrawing its progress.
+	See io_export.ExportJob for the arguments.
+	'''
+	global _exportJob
+
+	if _exportJob != None and not _exportJob.isDone():
+		print("[[ !! Warning ]] Already exporting, wait for it to finish or cancel it first")
+		tkmsg.showwarning(
+			title="Export Running",
+			message="Already exporting, wait for it to finish or cancel it first")
+		return
+
+	_exportJob = io_export.ExportJob(filepath, _passedProjectState, fileFormat, objCoefs, compression=compression, sharded=sharded)
+	_exportJob.start()
+
+	_btnCancelExport.configure(state=tk.NORMAL)
+	redrawExportProgress()
+
+
+def _askObjectiveCoefs () -> Dict[str, float]:
+	'''
+	Objective coefficients aren't stored in the project, so this asks for the
+	objective .csv and reads them. Returns None if it couldn't.
+	'''
+	objFilepathStr = io_file.getOpenFilepath(CSV_FILES)
+	if objFilepathStr == None:
+		return None
+
+	try:
+		return io_file.readObjectiveCoefs(objFilepathStr)
+	except (OSError, ValueError) as e:
+		print(f"[[ !! Warning ]] Couldn't read objective coefficients: {e}")
+		return None
 
 
 
@@ -139,23 +250,24 @@ def transitionToObjReplace () -> None:
 #
 
 def redrawConstrUpdate (constrGroupList: List[models.SetupConstraintGroup]) -> None:
-	global _constrPerGroup, _varsConstrainted
+	global _constrPerGroup, _termsPerGroup, _varsConstrainted
 
 	print("Constraint update")
 
 	# Generate global data
+	# (counted from the variable index, no equations get built)
 	_constrPerGroup = []
-	_varsConstrainted = []
+	_termsPerGroup = []
+	_varsConstrainted = 0
 
-	for cGroup in constrGroupList:
-		fullConstraint = proc.buildConstraintGroup(cGroup, _passedProjectState.varData)
+	# Redraws happen a lot, so they share one pool rather than starting their own
+	allCounts = parallel.countAllConstraints(constrGroupList, _passedProjectState.varData, keepPool=True)
 
-		_constrPerGroup.append(len(fullConstraint.equations))
+	for cGroup, counts in zip(constrGroupList, allCounts):
+		_constrPerGroup.append(counts.numEquations)
+		_termsPerGroup.append(counts.numLeftNonzeros + counts.numRightNonzeros)
 
-		for eq in fullConstraint.equations:
-			for var in eq.leftVars + eq.rightVars:
-				if var not in _varsConstrainted:
-					_varsConstrainted.append(var)
+		_varsConstrainted |= proc.findConstrainedBitset(cGroup, _passedProjectState.varData)
 
 	redrawConstrListFrame(constrGroupList)
 	redrawSummaryStats()
@@ -217,22 +329,25 @@ def redrawSummaryStats ():
 	global _lblSummary
 	
 	allVars = _passedProjectState.varData.all_vars
+	delim = _passedProjectState.varData.delim
 
 	allConNames = [x.namePrefix for x in _passedProjectState.setupList]
 	duplicateConCames = [x for x in allConNames if allConNames.count(x) > 1]
 	duplicateConCames = list(set(duplicateConCames))
 
-	unconVars = set(map(lambda x: "_".join(x), allVars)) - set(map(lambda x: "_".join(x), _varsConstrainted))
-	unconVars = list(unconVars)
+	NUM_UNCON_TO_SHOW = 10
+	unconBits = bitset.allVars(len(allVars)) & ~_varsConstrainted
+	unconVars = [delim.join(allVars[varId]) for varId in bitset.toIds(unconBits, NUM_UNCON_TO_SHOW)]
 
 	# Build the summary string
 	summaryStr = ""
 
 	totConstrs = sum(_constrPerGroup)
-	totUnConVars = len(unconVars)
+	totUnConVars = bitset.popcount(unconBits)
 	totVarsUsed = len(allVars) - totUnConVars
 
 	summaryStr += f'Constraints: {totConstrs}\n'
+	summaryStr += f'Left + Right Terms: {sum(_termsPerGroup)}\n'
 	summaryStr += f'Variables Used: {totVarsUsed}\n'
 	summaryStr += f'Variables Not Used: {totUnConVars}'
 
@@ -243,13 +358,11 @@ def redrawSummaryStats ():
 		summaryStr += ", ".join(duplicateConCames)
 
 	# display unconstrained variables
-	if len(unconVars) != 0:
+	if totUnConVars != 0:
 		summaryStr += "\n\n"
 
-		NUM_UNCON_TO_SHOW = 10
-		if len(unconVars) > NUM_UNCON_TO_SHOW:
+		if totUnConVars > NUM_UNCON_TO_SHOW:
 			summaryStr += f'First {NUM_UNCON_TO_SHOW} '
-			unconVars = unconVars[:NUM_UNCON_TO_SHOW]
 		summaryStr += 'unconstrained variables:\n'
 		summaryStr += ", ".join(unconVars)
 
@@ -257,6 +370,57 @@ def redrawSummaryStats ():
 	_lblSummary.configure(text=summaryStr)
 
 
+def redrawExportProgress () -> None:
+	'''
+	Shows how far along the export is, and keeps checking back until it's done
+	'''
+	global _exportPollId
+
+	# Only one poll at a time, this may be restarted after coming back to the screen
+	if _exportPollId != None:
+		_passedRoot.after_cancel(_exportPollId)
+		_exportPollId = None
+
+	if _exportJob == None:
+		return
+
+	# The screen may have been left while exporting
+	if not _pgbExport.winfo_exists():
+		return
+
+	progress = _exportJob.progress
+	_pgbExport.configure(maximum=max(progress.rowsTotal, 1), value=progress.rowsWritten)
+	_lblExportProgress.configure(
+		text=f"{progress.rowsWritten:,} / {progress.rowsTotal:,} rows ({progress.bytesWritten / 2**20:.1f} MiB)"
+	)
+
+	if not _exportJob.isDone():
+		_exportPollId = _passedRoot.after(EXPORT_POLL_MS, redrawExportProgress)
+		return
+
+	_btnCancelExport.configure(state=tk.DISABLED)
+
+	if _exportJob.cancelled:
+		print("Export cancelled, nothing was written")
+		_lblExportProgress.configure(text="Export cancelled")
+		_pgbExport.configure(value=0)
+	elif _exportJob.error != None:
+		_lblExportProgress.configure(text="Export failed")
+		_pgbExport.configure(value=0)
+		tkmsg.showerror(
+			title="Export Error",
+			message=f"Unable to export: {_exportJob.error}")
+	elif _exportJob.sharded:
+		print(f":D Files Written (see {Path(_exportJob.filepath) / io_file.MANIFEST_NAME})")
+		_lblExportProgress.configure(text="Export done")
+	elif _exportJob.fileFormat == 'longcsv':
+		print(f":D Files Written (right sides in {io_file.getSidecarPath(_exportJob.filepath)})")
+		_lblExportProgress.configure(text="Export done")
+	else:
+		print(":D File Written")
+		_lblExportProgress.configure(text="Export done")
+
+
 
 
 
@@ -305,6 +469,11 @@ def buildGUI_ProjectOverview(root: tk.Tk, projectState: models.ProjectState) ->
 
 	print("GUI Build, now redrawing some othe info")
 	redrawConstrUpdate(_constrGroupList)
+
+	# An export started before leaving the screen may still be running
+	if _exportJob != None and not _exportJob.isDone():
+		_btnCancelExport.configure(state=tk.NORMAL)
+		redrawExportProgress()
 	
 
 def buildConstraintGroupListFrame(root: tk.Tk) -> tk.Frame:
@@ -327,6 +496,8 @@ def buildConstraintButtonFrame(root: tk.Tk) -> tk.Frame:
 
 
 def buildExportButtonsFrame(root: tk.Tk) -> tk.Frame:
+	global _cbbShardFormat, _varShardGzip, _pgbExport, _lblExportProgress, _btnCancelExport
+
 	frmExport = tk.Frame(root)
 	frmExport.columnconfigure([x for x in range(1000)], weight=1)
 
@@ -339,6 +510,47 @@ def buildExportButtonsFrame(root: tk.Tk) -> tk.Frame:
 	btnExportProj = tk.Button(frmExport, text="Export to .csv", command=updateExportCSV)
 	btnExportProj.grid(row=0, column=2, sticky="e", padx=10, pady=10)
 
+	btnExportLong = tk.Button(frmExport, text="Export to sparse .csv", command=updateExportLongCSV)
+	btnExportLong.grid(row=0, column=3, sticky="e", padx=(0, 10), pady=10)
+
+	btnExportMPS = tk.Button(frmExport, text="Export to .mps", command=lambda: updateExportSolverFile('mps'))
+	btnExportMPS.grid(row=0, column=4, sticky="e", padx=(0, 10), pady=10)
+
+	btnExportLP = tk.Button(frmExport, text="Export to .lp", command=lambda: updateExportSolverFile('lp'))
+	btnExportLP.grid(row=0, column=5, sticky="e", padx=(0, 10), pady=10)
+
+	btnExportDAT = tk.Button(frmExport, text="Export to .dat", command=lambda: updateExportSolverFile('dat'))
+	btnExportDAT.grid(row=0, column=6, sticky="e", padx=(0, 10), pady=10)
+
+	# Exporting every group to its own file
+	frmSharded = tk.Frame(frmExport)
+	frmSharded.grid(row=1, column=2, columnspan=5, sticky="e", padx=(0, 10), pady=(0, 10))
+
+	btnExportSharded = tk.Button(frmSharded, text="Export groups separately as", command=updateExportSharded)
+	btnExportSharded.grid(row=0, column=0, sticky="e")
+
+	_cbbShardFormat = ttk.Combobox(frmSharded, values=list(io_file.EXPORT_FORMATS.keys()), state='readonly', width=WIDTH_SML)
+	_cbbShardFormat.set('csv')
+	_cbbShardFormat.grid(row=0, column=1, sticky="e", padx=(5, 0))
+
+	_varShardGzip = tk.StringVar(value='0')
+	ckbShardGzip = tk.Checkbutton(frmSharded, text="gzip", variable=_varShardGzip)
+	ckbShardGzip.grid(row=0, column=2, sticky="e", padx=(5, 0))
+
+	# Progress of the export running in the background
+	frmProgress = tk.Frame(frmExport)
+	frmProgress.grid(row=2, column=0, columnspan=7, sticky="ew", padx=10, pady=(0, 10))
+	frmProgress.columnconfigure(1, weight=1)
+
+	_lblExportProgress = tk.Label(frmProgress, text="", width=WIDTH_BIG, anchor="w")
+	_lblExportProgress.grid(row=0, column=0, sticky="w")
+
+	_pgbExport = ttk.Progressbar(frmProgress, orient=tk.HORIZONTAL, mode='determinate')
+	_pgbExport.grid(row=0, column=1, sticky="ew", padx=(5, 0))
+
+	_btnCancelExport = tk.Button(frmProgress, text="Cancel Export", command=updateCancelExport, state=tk.DISABLED)
+	_btnCancelExport.grid(row=0, column=2, sticky="e", padx=(5, 0))
+
 	return frmExport
 
 
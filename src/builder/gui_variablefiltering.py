@@ -49,6 +49,10 @@ class IncExc(Enum):
 # LSB_LOOKUP[Side][Exclude?]
 LSB_LOOKUP: Dict[Side, Dict[bool, Dict[str, tk.Listbox]]] = None
 
+# Tags shown in each listbox, in the same order and layout as LSB_LOOKUP.
+# Listbox items also have variable counts, so this maps them back to tags
+_lsbMembers: Dict[Side, Dict[bool, Dict[str, List[str]]]] = None
+
 # State Variables
 _varData: models.VarsData = None
 _constrGroupSetup: models.SetupConstraintGroup = None
@@ -137,22 +141,22 @@ def updateGeneralConstrInfo() -> None:
 
 
 def updateMoveTags(tag:str, toExclude: bool, side: Side) -> None:
-	DICT_LOOKUP = {
-		Side.LEFT: _constrGroupSetup.selLeftTags,
-		Side.RIGHT: _constrGroupSetup.selRightTags
-	}
-
 	lsb = LSB_LOOKUP[side][toExclude][tag]
+	lsbMembers = _lsbMembers[side][toExclude][tag]
 	selectedItems = []
 	selectedInds = lsb.curselection()
 	for ind in selectedInds:
-		selectedItems.append(lsb.get(ind))
+		selectedItems.append(lsbMembers[ind])
 	
+	# Moves update the already built constraints instead of rebuilding them
 	for item in selectedItems:
-		if toExclude:
-			DICT_LOOKUP[side][tag].remove(item)
-		else:
-			DICT_LOOKUP[side][tag].append(item)
+		move = models.TagMove(
+			tagGroup=tag,
+			tag=item,
+			onLeft=(side == Side.LEFT),
+			added=(not toExclude)
+		)
+		proc.applyTagMove(_constrGroupSetup, _varData, move)
 
 	redrawForUpdate()
 
@@ -208,37 +212,34 @@ def redrawGeneralInfoFrame ():
 
 
 def redrawIncExcLists ():
-	# Left Side
-	lIncTags = _constrGroupSetup.selLeftTags
-
-	lExcTags = copy.deepcopy(_varData.tag_members)
-	for tagGroup in _varData.tag_order:
-		for mem in lIncTags[tagGroup]:
-			if mem in lExcTags[tagGroup]:
-				lExcTags[tagGroup].remove(mem)
-
-	for tagGroup in lIncTags:
-		incVar = _incLeftVarDict[tagGroup]
-		excVar = _excLeftVarDict[tagGroup]
-
-		incVar.set(lIncTags[tagGroup])
-		excVar.set(lExcTags[tagGroup])
-
-	# Right Side
-	rIncTags = _constrGroupSetup.selRightTags
-
-	rExcTags = copy.deepcopy(_varData.tag_members)
-	for tagGroup in _varData.tag_order:
-		for mem in rIncTags[tagGroup]:
-			if mem in rExcTags[tagGroup]:
-				rExcTags[tagGroup].remove(mem)
-	
-	for tagGroup in rIncTags:
-		incVar = _incRightVarDict[tagGroup]
-		excVar = _excRightVarDict[tagGroup]
+	global _lsbMembers
+
+	_lsbMembers = {}
+
+	sides = [
+		(Side.LEFT, _constrGroupSetup.selLeftTags, _incLeftVarDict, _excLeftVarDict),
+		(Side.RIGHT, _constrGroupSetup.selRightTags, _incRightVarDict, _excRightVarDict)
+	]
+
+	for side, incTags, incVarDict, excVarDict in sides:
+		excTags = copy.deepcopy(_varData.tag_members)
+		for tagGroup in _varData.tag_order:
+			for mem in incTags[tagGroup]:
+				if mem in excTags[tagGroup]:
+					excTags[tagGroup].remove(mem)
+
+		# Moving tags out of a listbox includes or excludes them, see LSB_LOOKUP
+		_lsbMembers[side] = {
+			True: copy.deepcopy(incTags),
+			False: excTags
+		}
+
+		for tagGroup in incTags:
+			# Each tag shows how many variables it brings in (or would)
+			tagCounts = proc.countVarsPerTag(incTags, _varData, tagGroup)
 
-		incVar.set(rIncTags[tagGroup])
-		excVar.set(rExcTags[tagGroup])
+			incVarDict[tagGroup].set([f"{mem} ({tagCounts.get(mem, 0)})" for mem in incTags[tagGroup]])
+			excVarDict[tagGroup].set([f"{mem} ({tagCounts.get(mem, 0)})" for mem in excTags[tagGroup]])
 
 
 def redrawPreviewBox ():
@@ -251,8 +252,7 @@ def redrawPreviewBox ():
 	if _errWithGeneralInfo:
 		constrStr = _errWithGeneralInfo
 	else:
-		constGroup = proc.buildConstraintGroup(_constrGroupSetup, _varData)
-		constrStr = render.renderConstraintGroup(constGroup, _varData.delim)
+		constrStr = render.renderEquations(proc.iterEquations(_constrGroupSetup, _varData), _varData.delim)
 
 	_txtConstPreview.delete("1.0", tk.END)
 	_txtConstPreview.insert("1.0", constrStr)
@@ -0,0 +1,181 @@
+'''
+Parsed Objective Cache
+
+Keeps parsed objective files (see proc_ingest) on disk, so importing the
+same objective file again doesn't have to read and encode it all over again.
+
+Entries are keyed by the file's absolute path, size and modification time
+along with the delimiter, so editing (or replacing) the file makes its old
+entry unreachable. Old entries are cleared out once the cache gets too big,
+least recently used first.
+
+Entries are pickles, so only ever load ones this program wrote itself.
+'''
+
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+import builder.models as models
+
+
+
+# Folder the cache lives in, inside the user's cache folder
+CACHE_DIR_NAME = 'formom-builder'
+
+# Entries are cleared out (oldest used first) once they take up more than this
+CACHE_MAX_BYTES = 512 * (1 << 20)
+
+# Bumped whenever what's stored changes, so old entries aren't loaded
+CACHE_VERSION = 3
+
+CACHE_EXTENSION = '.pickle'
+
+# Same as what proc_ingest.ingestObjectiveFile returns, (parsed, errMsg)
+IngestResult = Tuple[models.ParsedObjective, str]
+
+
+
+def getCacheDir () -> Path:
+	'''
+	Returns the folder cache entries go in, following each platform's convention
+	for per-user caches. The folder might not exist yet.
+	'''
+	if sys.platform == 'win32':
+		baseDir = os.environ.get('LOCALAPPDATA', Path.home() / 'AppData' / 'Local')
+	elif sys.platform == 'darwin':
+		baseDir = Path.home() / 'Library' / 'Caches'
+	else:
+		baseDir = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+
+	return Path(baseDir) / CACHE_DIR_NAME
+
+
+def loadIngestResult (objCSVPath: Path, delim: str, cacheDir: Path = None) -> IngestResult:
+	'''
+	Returns the cached (parsed, errMsg) for the objective file, or None if it
+	isn't cached (or the file has changed since it was).
+	'''
+	cacheDir = Path(cacheDir) if cacheDir != None else getCacheDir()
+
+	key = _getCacheKey(objCSVPath, delim)
+	if key == None:
+		return None
+
+	entryPath = _getEntryPath(cacheDir, key)
+	try:
+		with open(entryPath, 'rb') as entryFile:
+			entry = pickle.load(entryFile)
+	except FileNotFoundError:
+		return None
+	except Exception as e:
+		# Half written, or from some other version of the program
+		print(f"[[ !! Warning ]] Dropping unreadable cache entry {entryPath}: {e}")
+		_removeEntry(entryPath)
+		return None
+
+	if not isinstance(entry, dict) or entry.get('key') != key:
+		_removeEntry(entryPath)
+		return None
+
+	# Marks it as recently used, for eviction
+	try:
+		os.utime(entryPath)
+	except OSError:
+		pass
+
+	return entry['parsed'], entry['errMsg']
+
+
+def saveIngestResult (objCSVPath: Path, delim: str, result: IngestResult, cacheDir: Path = None) -> None:
+	'''
+	Caches the (parsed, errMsg) for the objective file, then clears out old
+	entries if the cache is too big. Failing to write the cache isn't an error,
+	the file just gets read again next time.
+	'''
+	cacheDir = Path(cacheDir) if cacheDir != None else getCacheDir()
+
+	key = _getCacheKey(objCSVPath, delim)
+	if key == None:
+		return
+
+	parsed, errMsg = result
+	entry = {
+		'key': key,
+		'parsed': parsed,
+		'errMsg': errMsg
+	}
+
+	try:
+		cacheDir.mkdir(parents=True, exist_ok=True)
+
+		# Written next to where it goes and moved into place, so a half written
+		# entry is never loaded
+		fd, tempPath = tempfile.mkstemp(dir=cacheDir, suffix='.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as entryFile:
+				pickle.dump(entry, entryFile, protocol=5)
+			os.replace(tempPath, _getEntryPath(cacheDir, key))
+		except BaseException:
+			_removeEntry(Path(tempPath))
+			raise
+
+	except OSError as e:
+		print(f"[[ !! Warning ]] Couldn't write to the cache in {cacheDir}: {e}")
+		return
+
+	evictEntries(cacheDir)
+
+
+def evictEntries (cacheDir: Path = None, maxBytes: int = CACHE_MAX_BYTES) -> None:
+	'''
+	Removes the least recently used entries until the cache takes up at most maxBytes
+	'''
+	cacheDir = Path(cacheDir) if cacheDir != None else getCacheDir()
+
+	entries: List[Tuple[float, int, Path]] = []
+	for entryPath in cacheDir.glob('*' + CACHE_EXTENSION):
+		try:
+			stat = entryPath.stat()
+		except OSError:
+			continue
+		entries.append((stat.st_mtime, stat.st_size, entryPath))
+
+	totalBytes = sum([size for _, size, _ in entries])
+	for _, size, entryPath in sorted(entries):
+		if totalBytes <= maxBytes:
+			break
+		_removeEntry(entryPath)
+		totalBytes -= size
+
+
+def clearCache (cacheDir: Path = None) -> None:
+	evictEntries(cacheDir, maxBytes=0)
+
+
+def _getCacheKey (objCSVPath: Path, delim: str) -> Tuple:
+	'''
+	Returns None if the file can't be looked at
+	'''
+	try:
+		absPath = os.path.abspath(objCSVPath)
+		stat = os.stat(absPath)
+	except (OSError, TypeError, ValueError):
+		return None
+
+	return (CACHE_VERSION, absPath, stat.st_size, stat.st_mtime_ns, delim)
+
+
+def _getEntryPath (cacheDir: Path, key: Tuple) -> Path:
+	return cacheDir / (hashlib.sha1(repr(key).encode()).hexdigest() + CACHE_EXTENSION)
+
+
+def _removeEntry (entryPath: Path) -> None:
+	try:
+		os.remove(entryPath)
+	except OSError:
+		pass
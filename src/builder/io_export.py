@@ -0,0 +1,199 @@
+'''
+Export Jobs
+
+Runs an export (see io_file.exportToFile and io_file.writeShardedExport) on a
+background thread, so the GUI doesn't freeze while big projects are written out.
+
+Jobs report how far along they are through a callback (and job.progress),
+and can be cancelled. Files are written into a temporary folder next to
+the real file, and only moved into place once the export is done, so a
+cancelled or failed export never leaves a partial file behind.
+'''
+
+import copy
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+import builder.io_file as io_file
+import builder.models as models
+import builder.proc_parallel as parallel
+
+
+
+class ExportCancelled (Exception):
+	'''
+	Raised inside an export to stop it, once its CancelToken is cancelled
+	'''
+	pass
+
+
+class CancelToken:
+	'''
+	Shared between whoever wants to cancel a job (eg: the GUI) and the job
+	'''
+
+	def __init__(self):
+		self._event = threading.Event()
+
+	def cancel(self) -> None:
+		self._event.set()
+
+	def isCancelled(self) -> bool:
+		return self._event.is_set()
+
+
+
+# Checking the file's size on every row would be slow, so it's checked at most this often (seconds)
+BYTES_CHECK_INTERVAL = 0.1
+
+
+
+class ExportJob:
+	'''
+	A single export of a project state to filepath, in one of io_file.EXPORT_FORMATS.
+
+	sharded: Export every group to its own file instead (see io_file.writeShardedExport),
+		filepath being the folder they go in
+	onProgress: Called with a models.ExportProgress after every row. It's called
+		from the export's thread, so GUIs should poll job.progress instead
+	cancelToken: Cancels the job when cancelled. One is made if not given
+
+	== Example
+	job = ExportJob('constraints.csv', projState, 'csv')
+	job.start()
+	...
+	job.cancel() # Or wait for job.isDone()
+	'''
+
+	def __init__(self, filepath: str, projState: models.ProjectState, fileFormat: str,
+			objCoefs: Dict[str, float] = None, compression: str = 'auto',
+			onProgress: Callable[[models.ExportProgress], None] = None, cancelToken: CancelToken = None,
+			sharded: bool = False):
+		self.filepath = str(filepath)
+		self.fileFormat = fileFormat
+		self.sharded = sharded
+		self.objCoefs = objCoefs
+		self.compression = compression
+		self.onProgress = onProgress
+		self.cancelToken = cancelToken if cancelToken != None else CancelToken()
+
+		# Constraint groups can be edited while the export runs, so it gets its own copy
+		self.projState = models.ProjectState(
+			varData=projState.varData,
+			setupList=copy.deepcopy(projState.setupList)
+		)
+
+		self.progress = models.ExportProgress(rowsWritten=0, rowsTotal=0, bytesWritten=0)
+		self.cancelled = False
+		self.error: Exception = None
+
+		self._thread: threading.Thread = None
+		self._tempDir: str = None
+		self._lastBytesCheck = 0.0
+		self._done = False
+
+	def start(self) -> None:
+		'''
+		Runs the export on a background thread
+		'''
+		self._thread = threading.Thread(target=self.run, daemon=True)
+		self._thread.start()
+
+	def cancel(self) -> None:
+		self.cancelToken.cancel()
+
+	def isDone(self) -> bool:
+		return self._done
+
+	def succeeded(self) -> bool:
+		return self.isDone() and not self.cancelled and self.error == None
+
+	def run(self) -> None:
+		'''
+		Runs the export on the calling thread. Cancelling sets job.cancelled,
+		and anything else going wrong ends up in job.error
+		'''
+		outDir = Path(self.filepath) if self.sharded else Path(self.filepath).parent
+		tempDir = None
+
+		try:
+			tempDir = tempfile.mkdtemp(prefix='.export-', dir=outDir)
+			self._tempDir = tempDir
+
+			allCounts = parallel.countAllConstraints(self.projState.setupList, self.projState.varData)
+			self._setProgress(0, sum([counts.numEquations for counts in allCounts]), 0)
+
+			if self.sharded:
+				io_file.writeShardedExport(
+					tempDir,
+					self.projState,
+					self.fileFormat,
+					self.objCoefs,
+					compression=None if self.compression == 'auto' else self.compression,
+					rowCallback=self._onRows
+				)
+			else:
+				io_file.exportToFile(
+					str(Path(tempDir) / Path(self.filepath).name),
+					self.projState,
+					self.fileFormat,
+					self.objCoefs,
+					compression=self.compression,
+					rowCallback=self._onRows
+				)
+
+			bytesWritten = self._getBytesWritten()
+
+			# Only now does anything show up where the files were asked for
+			for filename in os.listdir(tempDir):
+				os.replace(Path(tempDir) / filename, outDir / filename)
+
+			self._setProgress(self.progress.rowsWritten, self.progress.rowsTotal, bytesWritten)
+
+		except ExportCancelled:
+			self.cancelled = True
+		except Exception as e:
+			print(f"[[ !! Warning ]] Export to {self.filepath} failed: {e}")
+			self.error = e
+		finally:
+			if tempDir != None:
+				shutil.rmtree(tempDir, ignore_errors=True)
+			self._done = True
+
+	def _onRows(self, numRows: int) -> None:
+		if self.cancelToken.isCancelled():
+			raise ExportCancelled()
+
+		bytesWritten = self.progress.bytesWritten
+		if time.monotonic() - self._lastBytesCheck >= BYTES_CHECK_INTERVAL:
+			self._lastBytesCheck = time.monotonic()
+			bytesWritten = self._getBytesWritten()
+
+		self._setProgress(self.progress.rowsWritten + numRows, self.progress.rowsTotal, bytesWritten)
+
+	def _getBytesWritten(self) -> int:
+		'''
+		Size of everything written into the temporary folder so far
+		'''
+		bytesWritten = 0
+		for entry in os.scandir(self._tempDir):
+			try:
+				bytesWritten += entry.stat().st_size
+			except OSError:
+				pass
+		return bytesWritten
+
+	def _setProgress(self, rowsWritten: int, rowsTotal: int, bytesWritten: int) -> None:
+		self.progress = models.ExportProgress(
+			rowsWritten=rowsWritten,
+			rowsTotal=rowsTotal,
+			bytesWritten=bytesWritten
+		)
+
+		if self.onProgress != None:
+			self.onProgress(self.progress)
@@ -8,14 +8,52 @@ Also deals with some tkinter weirdness of multiple return types.
 
 from pathlib import Path
 from tkinter import dialog, filedialog
-from typing import Any, List, Tuple, Type
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Type
 import csv
-import copy
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import re
+import shutil
+import tempfile
 
 import builder.models as models
 import builder.proc_constraints as proc
+import builder.proc_parallel as parallel
+import builder.proc_varindex as varindex
 
 
+# Written for every variable not in an equation. Same text csv writes for 0.0
+ZERO_COEF = '0.0'
+
+# Name of the objective row in .mps / .lp files
+OBJ_ROW_NAME = 'obj'
+
+# Number of terms per line in .lp files, solvers don't like really long lines
+LP_TERMS_PER_LINE = 8
+
+# Exports are big sequential writes, so they get written in big chunks
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Exporters take an optional rowCallback, which gets called with the number
+# of constraints just written. Raising from it stops the export
+RowCallback = Callable[[int], None]
+
+# Number of variables read for previews, see readVarnamesSample
+SAMPLE_SIZE = 200
+
+# How often (in columns) writeToMPS calls its rowCallback while writing COLUMNS
+MPS_COLUMNS_PER_CALLBACK = 1000
+
+# Compression of exported files, and their extensions
+COMPRESSION_EXTENSIONS = {
+	'gzip': '.gz',
+	'xz': '.xz'
+}
+
 
 #
 # User Input
@@ -59,6 +97,18 @@ def getOpenFilepath (filetypes: List[Tuple[str]]) -> str:
 	return str(filepath)
 
 
+def getDirectoryPath () -> str:
+	'''
+	Runs the tkinter askdirectory but returns None if
+	the directory was invalid.
+	'''
+	dirpath = filedialog.askdirectory()
+
+	if _isInvalidFile(dirpath):
+		return None
+	return str(dirpath)
+
+
 def _isInvalidFile (filepath: str) -> bool:
 	return filepath == None or \
 		len(filepath) == 0 or \
@@ -84,19 +134,107 @@ def readVarnamesRaw (objCSVPath: Path, numVars=-1) -> List[str]:
 	'''
 	allVarnames = []
 
-	with open(objCSVPath, 'r') as objFile:
+	for varName in iterVarnamesRaw(objCSVPath):
+		if numVars >= 0 and len(allVarnames) >= numVars:
+			break
+		allVarnames.append(varName)
+
+	return allVarnames
+
+
+def iterVarnamesRaw (objCSVPath: Path) -> Iterator[str]:
+	'''
+	Same as readVarnamesRaw, but yields the names one at a time
+	as the file is read, so the whole list is never in memory.
+	Blank lines are skipped.
+	'''
+	with open(objCSVPath, 'r', newline='') as objFile:
+		r = csv.reader(objFile)
+		next(r, None) # Header
+
+		for row in r:
+			if len(row) == 0:
+				continue
+			yield row[0].strip()
+
+
+def iterNumberedVarnames (objCSVPath: Path) -> Iterator[Tuple[int, str]]:
+	'''
+	Same as iterVarnamesRaw, but yields (row, name), row being the line of the
+	file the name is on (the header is row 1). Blank lines are skipped, but still
+	counted, so rows match what's in the file.
+	'''
+	with open(objCSVPath, 'r', newline='') as objFile:
 		r = csv.reader(objFile)
-		lineCount = 0
+		next(r, None) # Header
+
 		for row in r:
-			lineCount += 1
-			if lineCount == 1:
+			if len(row) == 0:
 				continue
-			if numVars >= 0 and len(allVarnames) >= numVars:
+			yield r.line_num, row[0].strip()
+
+
+def readVarnamesSample (objCSVPath: Path, numVars: int = SAMPLE_SIZE, spread: bool = False) -> List[str]:
+	'''
+	Reads a few variable names for previews, without reading the whole file.
+
+	By default these are the first numVars names, like readVarnamesRaw. With
+	spread, they're taken from evenly spaced points throughout the file (the
+	first name is always first), so problems further down are more likely to
+	show up. Either way it takes about as long for a huge file as a tiny one.
+	'''
+	if not spread:
+		return readVarnamesRaw(objCSVPath, numVars)
+
+	fileSize = os.path.getsize(objCSVPath)
+	sampleVarnames = []
+
+	# Binary, since text files can't seek to arbitrary positions
+	with open(objCSVPath, 'rb') as objFile:
+		objFile.readline() # Header
+		dataStart = objFile.tell()
+		pos = dataStart
+
+		for ind in range(numVars):
+			jumpPos = dataStart + (fileSize - dataStart) * ind // numVars
+
+			if jumpPos > pos:
+				# Lands mid line, so skip to the start of the next one
+				objFile.seek(jumpPos - 1)
+				objFile.readline()
+			else:
+				# Small files, the jumps are closer together than the lines
+				objFile.seek(pos)
+
+			line = objFile.readline()
+			pos = objFile.tell()
+			if len(line) == 0:
 				break
 
-			allVarnames.append(str(row[0]).strip())
+			row = next(csv.reader([line.decode(errors='replace')]), [])
+			if len(row) != 0:
+				sampleVarnames.append(row[0].strip())
 
-	return allVarnames
+	return sampleVarnames
+
+
+def readObjectiveCoefs (objCSVPath: Path) -> Dict[str, float]:
+	'''
+	Reads the objective file into a dictionary between variable
+	names and their objective coefficients (the second column).
+	'''
+	objCoefs = {}
+
+	with open(objCSVPath, 'r') as objFile:
+		r = csv.reader(objFile)
+		next(r, None) # Header
+
+		for row in r:
+			if len(row) < 2:
+				continue
+			objCoefs[str(row[0]).strip()] = float(row[1])
+
+	return objCoefs
 
 
 
@@ -109,48 +247,516 @@ def readVarnamesRaw (objCSVPath: Path, numVars=-1) -> List[str]:
 # Writing
 #
 
-def writeToCSV (filepath: str, projState: models.ProjectState):
+def writeToCSV (filepath: str, projState: models.ProjectState, compression: str = 'auto', rowCallback: RowCallback = None):
 	'''
 	Converts the project state into a constraint .csv
 	
-	This is how projects get exported
+	This is how projects get exported. See openOutputFile for compression,
+	and RowCallback for rowCallback
 	'''
-	with open(filepath, 'w', newline='') as outFile:
+	with openOutputFile(filepath, compression, newline='') as outFile:
 		writer = csv.writer(outFile)
 
-		delim = projState.varData.delim
-		allVarNamesSorted = copy.deepcopy(projState.varData.all_vars)
-		allVarNamesSorted.sort(key=lambda tags: "".join(tags))
-		allVarNamesRaw = [delim.join(x) for x in allVarNamesSorted]
+		index = varindex.getVarIndex(projState.varData)
+
+		writer.writerow(['const_name'] + index.exportNames + ['operator', 'rtSide'])
+		writer.writerows(iterCSVRows(projState, rowCallback))
+
+
+def iterCSVRows (projState: models.ProjectState, rowCallback: RowCallback = None) -> Iterator[List[Any]]:
+	'''
+	Generates the rows of the constraint .csv (without the header), one per
+	equation, as the constraint groups get built.
+
+	The same list is reused for every row, so write it out (or copy it) before
+	asking for the next one.
+	'''
+	index = varindex.getVarIndex(projState.varData)
+	numCols = len(index.exportOrder)
+
+	# Rows start out as all zeros, and only the nonzero coefficients get
+	# written in. Those get zeroed again once the row has been used, so building
+	# a row only costs as much as the equation's size
+	row = [''] + [ZERO_COEF] * numCols + ['', '']
+	opNames = {sign.toCode(): sign.exportName() for sign in models.ComparisonSign}
+
+	# Groups are built in parallel, and written as they come back (in order)
+	for matrix in parallel.iterConstraintMatrices(projState.setupList, projState.varData):
+		for rowInd in range(matrix.numRows()):
+			cols, coefs = matrix.getRow(rowInd)
+
+			row[0] = matrix.rowNames[rowInd]
+			row[-2] = opNames[matrix.ops[rowInd]]
+			row[-1] = matrix.rhs[rowInd]
+			for col, coef in zip(cols, coefs):
+				row[col + 1] = coef
+
+			yield row
+
+			if rowCallback != None:
+				rowCallback(1)
+
+			for col in cols:
+				row[col + 1] = ZERO_COEF
+
+
+def writeToLongCSV (filepath: str, projState: models.ProjectState, compression: str = 'auto', rowCallback: RowCallback = None):
+	'''
+	Converts the project state into a sparse (long format) constraint .csv,
+	with one line per nonzero coefficient:
+		const_name,variable,coef
+
+	The operator and right side of every constraint go in a second, much
+	smaller file next to it (see getSidecarPath):
+		const_name,operator,rtSide
+
+	Both are written as the constraint groups get built, and both get the
+	same compression (see openOutputFile). See RowCallback for rowCallback.
+	'''
+	index = varindex.getVarIndex(projState.varData)
+	colNames = index.exportNames
+	opNames = {sign.toCode(): sign.exportName() for sign in models.ComparisonSign}
+
+	sidecarPath = getSidecarPath(filepath)
+	if compression == 'auto':
+		compression = _getCompressionFromPath(filepath)
+
+	with openOutputFile(filepath, compression, newline='') as outFile, openOutputFile(sidecarPath, compression, newline='') as sideFile:
+		writer = csv.writer(outFile)
+		sideWriter = csv.writer(sideFile)
+
+		writer.writerow(['const_name', 'variable', 'coef'])
+		sideWriter.writerow(['const_name', 'operator', 'rtSide'])
+
+		for matrix in parallel.iterConstraintMatrices(projState.setupList, projState.varData):
+			for rowInd in range(matrix.numRows()):
+				name = matrix.rowNames[rowInd]
+				cols, coefs = matrix.getRow(rowInd)
+
+				writer.writerows([(name, colNames[col], coef) for col, coef in zip(cols, coefs)])
+				sideWriter.writerow([name, opNames[matrix.ops[rowInd]], matrix.rhs[rowInd]])
+
+				if rowCallback != None:
+					rowCallback(1)
+
+
+def getSidecarPath (filepath: str) -> str:
+	'''
+	Where writeToLongCSV puts operators and right sides, eg:
+	constraints.csv -> constraints_rhs.csv
+	constraints.csv.gz -> constraints_rhs.csv.gz
+	'''
+	path = Path(filepath)
+
+	compressedSuffix = ''
+	if path.suffix.lower() in COMPRESSION_EXTENSIONS.values():
+		compressedSuffix = path.suffix
+		path = path.with_suffix('')
+
+	return str(path.with_name(path.stem + '_rhs' + path.suffix + compressedSuffix))
+
+
+
+def writeToMPS (filepath: str, projState: models.ProjectState, objCoefs: Dict[str, float] = None, maximize: bool = True, compression: str = 'auto', rowCallback: RowCallback = None):
+	'''
+	Converts the project state into a (free format) .mps file for solvers, with
+	the objective coefficients from objCoefs (see readObjectiveCoefs).
+	See openOutputFile for compression, and RowCallback for rowCallback.
+
+	MPS lists the matrix column by column, so the constraint groups are built
+	first and their (sparse) matrices transposed. Nothing dense is ever made.
+	Because of that, rows aren't written one at a time, and rowCallback hears
+	about them as the columns get written (in proportion to the nonzeros written).
+	'''
+	index = varindex.getVarIndex(projState.varData)
+	colNames = [_toSolverName(name) for name in index.exportNames]
+
+	matrix = models.ConstraintMatrix.createEmpty(index.exportNames)
+	for groupMatrix in parallel.iterConstraintMatrices(projState.setupList, projState.varData):
+		matrix.extend(groupMatrix)
+
+		# Nothing's written yet, but this lets the export be stopped
+		if rowCallback != None:
+			rowCallback(0)
+	colStarts, rowInds, colCoefs = matrix.toColumnForm()
+
+	numRows = matrix.numRows()
+	numNonzeros = len(rowInds)
+	rowsReported = 0
+
+	rowNames = [_toSolverName(name) for name in matrix.rowNames]
+	rowTypes = {sign.toCode(): sign.exportName()[0].upper() for sign in models.ComparisonSign}
 
-		writer.writerow(['const_name'] + allVarNamesRaw + ['operator', 'rtSide'])
+	if objCoefs == None:
+		objCoefs = {}
 
-		rowLen = len(allVarNamesSorted) + 3
+	with openOutputFile(filepath, compression) as outFile:
+		outFile.write(f'NAME {_toSolverName(_getBaseName(filepath))}\n')
+		if maximize:
+			outFile.write('OBJSENSE\n    MAX\n')
 
-		for setupGroup in projState.setupList:
-			constrGroup: models.ConstraintGroup = proc.buildConstraintGroup(setupGroup, projState.varData)
+		outFile.write('ROWS\n')
+		outFile.write(f' N  {OBJ_ROW_NAME}\n')
+		for name, op in zip(rowNames, matrix.ops):
+			outFile.write(f' {rowTypes[op]}  {name}\n')
 
-			for constr in constrGroup.equations:
-				newRow = [''] * rowLen
+		outFile.write('COLUMNS\n')
+		for col, colName in enumerate(colNames):
+			start = colStarts[col]
+			end = colStarts[col + 1]
 
-				name = constr.namePrefix
-				if constr.nameSuffix != '':
-					name += delim + constr.nameSuffix
-				newRow[0] = name
-				newRow[-1] = constr.constant
-				newRow[-2] = constr.comparison.exportName()
+			# Variables in no constraints still get listed, so every variable exists
+			objCoef = objCoefs.get(index.exportNames[col], 0.0)
+			if objCoef != 0 or start == end:
+				outFile.write(f'    {colName}  {OBJ_ROW_NAME}  {float(objCoef)!r}\n')
 
-				for ind, var in enumerate(allVarNamesSorted):
-					coef = 0.0
-					if var in constr.leftVars:
-						# leftInd = 
-						leftInd = constr.leftVars.index(var)
-						coef += constr.leftCoefs[leftInd]
-					if var in constr.rightVars:
-						rightInd = constr.rightVars.index(var)
-						coef -= constr.rightCoefs[rightInd]
-					newRow[ind+1] = coef
+			for ind in range(start, end):
+				outFile.write(f'    {colName}  {rowNames[rowInds[ind]]}  {colCoefs[ind]!r}\n')
+
+			if rowCallback != None and col % MPS_COLUMNS_PER_CALLBACK == 0:
+				rowsDone = numRows * end // numNonzeros if numNonzeros != 0 else 0
+				rowCallback(rowsDone - rowsReported)
+				rowsReported = rowsDone
+
+		if rowCallback != None:
+			rowCallback(numRows - rowsReported)
+
+		outFile.write('RHS\n')
+		for name, rhs in zip(rowNames, matrix.rhs):
+			if rhs != 0:
+				outFile.write(f'    RHS  {name}  {rhs!r}\n')
+
+		outFile.write('ENDATA\n')
+
+
+def writeToLP (filepath: str, projState: models.ProjectState, objCoefs: Dict[str, float] = None, maximize: bool = True, compression: str = 'auto', rowCallback: RowCallback = None):
+	'''
+	Converts the project state into a CPLEX .lp file for solvers, with
+	the objective coefficients from objCoefs (see readObjectiveCoefs).
+	See openOutputFile for compression, and RowCallback for rowCallback.
+
+	Constraints are written as the constraint groups get built.
+	'''
+	index = varindex.getVarIndex(projState.varData)
+	colNames = [_toSolverName(name, forLP=True) for name in index.exportNames]
+
+	lpSigns = {'ge': '>=', 'le': '<=', 'eq': '='}
+	rowSigns = {sign.toCode(): lpSigns[sign.exportName()] for sign in models.ComparisonSign}
+
+	if objCoefs == None:
+		objCoefs = {}
+
+	with openOutputFile(filepath, compression) as outFile:
+		outFile.write('Maximize\n' if maximize else 'Minimize\n')
+
+		objTerms = []
+		for col, name in enumerate(index.exportNames):
+			objCoef = objCoefs.get(name, 0.0)
+			if objCoef != 0:
+				objTerms.append((objCoef, col))
+		# An objective needs at least one term
+		if len(objTerms) == 0 and len(colNames) != 0:
+			objTerms.append((0.0, 0))
+		_writeLPExpression(outFile, f' {OBJ_ROW_NAME}:', objTerms, colNames, '')
+
+		outFile.write('Subject To\n')
+		for matrix in parallel.iterConstraintMatrices(projState.setupList, projState.varData):
+			for rowInd in range(matrix.numRows()):
+				cols, coefs = matrix.getRow(rowInd)
+				_writeLPExpression(
+					outFile,
+					f' {_toSolverName(matrix.rowNames[rowInd], forLP=True)}:',
+					zip(coefs, cols),
+					colNames,
+					f' {rowSigns[matrix.ops[rowInd]]} {matrix.rhs[rowInd]!r}'
+				)
+
+				if rowCallback != None:
+					rowCallback(1)
+
+		outFile.write('End\n')
+
+
+def _writeLPExpression (outFile, start: str, terms, colNames: List[str], end: str) -> None:
+	'''
+	Writes "start + 2.0 var1 - 3.0 var2 ... end", wrapping every few terms
+	'''
+	line = start
+	for ind, (coef, col) in enumerate(terms):
+		if ind != 0 and ind % LP_TERMS_PER_LINE == 0:
+			outFile.write(line + '\n')
+			line = '   '
+
+		sign = '-' if coef < 0 else '+'
+		line += f' {sign} {abs(float(coef))!r} {colNames[col]}'
+
+	outFile.write(line + end + '\n')
+
+
+# Solvers split names on anything other than these characters
+_INVALID_NAME_CHARS = re.compile('[^A-Za-z0-9_.]')
+# .lp names can't look like numbers
+_INVALID_LP_START = re.compile('[0-9.]|[eE][0-9eE]')
+
+def _toSolverName (name: str, forLP: bool = False) -> str:
+	'''
+	Makes a variable / constraint name safe for .mps and .lp files. Characters
+	solvers can't handle (eg: a "-" or " " delimiter) become underscores, and
+	in .lp files names can't start like a number, so those get an underscore
+	in front.
+	'''
+	name = _INVALID_NAME_CHARS.sub('_', name)
+
+	if forLP and _INVALID_LP_START.match(name):
+		name = '_' + name
+
+	return name
+
+
+
+def writeToDAT (filepath: str, projState: models.ProjectState, objCoefs: Dict[str, float] = None, compression: str = 'auto', rowCallback: RowCallback = None):
+	'''
+	Converts the project state into an AMPL / Pyomo .dat file:
+	 - set VARS, set CONSTRS: every variable and constraint name
+	 - param A: the constraint matrix, only nonzero entries (constraint, variable, coef)
+	 - param rhs: right side of each constraint
+	 - set GE_CONSTRS, LE_CONSTRS, EQ_CONSTRS: constraints by comparison
+	 - param obj: objective coefficients, only when objCoefs is given
+
+	The A table is written as the constraint groups get built. Params with no
+	entries are left out, since empty tables don't parse. See openOutputFile
+	for compression, and RowCallback for rowCallback.
+	'''
+	index = varindex.getVarIndex(projState.varData)
+	colNames = [_toDatName(name) for name in index.exportNames]
+
+	rowNames: List[str] = []
+	rowOps = []
+	rowRhs = []
+	numNonzeros = 0
+
+	with openOutputFile(filepath, compression) as outFile, tempfile.TemporaryFile('w+', dir=Path(filepath).parent) as aFile:
+		# Constraint names are only known once everything is built, but sets need
+		# to come first. So the A table goes to a temporary file and gets copied over
+		aFile.write('param A :=\n')
+		for matrix in parallel.iterConstraintMatrices(projState.setupList, projState.varData):
+			for rowInd in range(matrix.numRows()):
+				name = _toDatName(matrix.rowNames[rowInd])
+				cols, coefs = matrix.getRow(rowInd)
+
+				for col, coef in zip(cols, coefs):
+					aFile.write(f'{name} {colNames[col]} {coef!r}\n')
+				numNonzeros += len(cols)
+
+				rowNames.append(name)
+				rowOps.append(matrix.ops[rowInd])
+				rowRhs.append(matrix.rhs[rowInd])
+
+				if rowCallback != None:
+					rowCallback(1)
+		aFile.write(';\n\n')
+
+		_writeDATSet(outFile, 'VARS', colNames)
+		_writeDATSet(outFile, 'CONSTRS', rowNames)
+
+		if numNonzeros != 0:
+			aFile.seek(0)
+			shutil.copyfileobj(aFile, outFile)
+
+		_writeDATParam(outFile, 'rhs', [(name, rhs) for name, rhs in zip(rowNames, rowRhs)])
+
+		for sign in models.ComparisonSign:
+			code = sign.toCode()
+			signRows = [name for name, op in zip(rowNames, rowOps) if op == code]
+			_writeDATSet(outFile, f'{sign.exportName().upper()}_CONSTRS', signRows)
+
+		if objCoefs != None:
+			objEntries = []
+			for col, name in enumerate(index.exportNames):
+				objCoef = objCoefs.get(name, 0.0)
+				if objCoef != 0:
+					objEntries.append((colNames[col], float(objCoef)))
+			_writeDATParam(outFile, 'obj', objEntries)
+
+
+def _writeDATSet (outFile, setName: str, members: List[str]) -> None:
+	outFile.write(f'set {setName} :=\n')
+	for member in members:
+		outFile.write(member + '\n')
+	outFile.write(';\n\n')
+
+
+def _writeDATParam (outFile, paramName: str, entries: List[Tuple[str, float]]) -> None:
+	if len(entries) == 0:
+		return
+
+	outFile.write(f'param {paramName} :=\n')
+	for name, value in entries:
+		outFile.write(f'{name} {value!r}\n')
+	outFile.write(';\n\n')
+
+
+# Names like these can go into .dat files without quotes
+_PLAIN_DAT_NAME = re.compile('[A-Za-z0-9_.]+')
+
+def _toDatName (name: str) -> str:
+	'''
+	Quotes names which .dat files wouldn't read as a plain name (eg: ones with
+	a space delimiter, or ones which look like a number)
+	'''
+	if _PLAIN_DAT_NAME.fullmatch(name):
+		try:
+			float(name)
+		except ValueError:
+			return name
+
+	return "'" + name.replace("'", "''") + "'"
+
+
+
+
+#
+# Exporting by format
+#
+
+# Formats every exporter can write, and their file extension
+EXPORT_FORMATS = {
+	'csv': '.csv',
+	'longcsv': '.csv',
+	'mps': '.mps',
+	'lp': '.lp',
+	'dat': '.dat'
+}
+
+# Name of the manifest writeShardedExport puts next to the files
+MANIFEST_NAME = 'manifest.json'
+
+
+def exportToFile (filepath: str, projState: models.ProjectState, fileFormat: str, objCoefs: Dict[str, float] = None, compression: str = 'auto', rowCallback: RowCallback = None):
+	'''
+	Exports the project state in one of EXPORT_FORMATS. Objective coefficients
+	are only used by the solver formats. See openOutputFile for compression,
+	and RowCallback for rowCallback.
+	'''
+	if fileFormat == 'csv':
+		writeToCSV(filepath, projState, compression=compression, rowCallback=rowCallback)
+	elif fileFormat == 'longcsv':
+		writeToLongCSV(filepath, projState, compression=compression, rowCallback=rowCallback)
+	elif fileFormat == 'mps':
+		writeToMPS(filepath, projState, objCoefs, compression=compression, rowCallback=rowCallback)
+	elif fileFormat == 'lp':
+		writeToLP(filepath, projState, objCoefs, compression=compression, rowCallback=rowCallback)
+	elif fileFormat == 'dat':
+		writeToDAT(filepath, projState, objCoefs, compression=compression, rowCallback=rowCallback)
+	else:
+		raise ValueError(f'Unknown export format "{fileFormat}"')
+
+
+def writeShardedExport (dirpath: str, projState: models.ProjectState, fileFormat: str, objCoefs: Dict[str, float] = None, maxWorkers: int = None, compression: str = None, rowCallback: RowCallback = None) -> str:
+	'''
+	Exports every constraint group into its own file in dirpath, eg:
+	000_standard.csv, 001_maxCut.csv, ... (or 000_standard.csv.gz, ...
+	with compression='gzip')
+
+	Files are written in parallel (see proc_parallel). A manifest listing each
+	file, its group, number of rows and sha256 checksum is written last, and its
+	path is returned. rowCallback hears about each group's rows once its file is done.
+	'''
+	shards = []
+	for ind, setup in enumerate(projState.setupList):
+		filename = f'{ind:03d}_{_INVALID_NAME_CHARS.sub("_", setup.namePrefix)}{EXPORT_FORMATS[fileFormat]}'
+		if compression != None:
+			filename += COMPRESSION_EXTENSIONS[compression]
+		shards.append((str(Path(dirpath) / filename), setup))
+
+	# Sent to each worker once, rather than with every group
+	taskKwargs = {'fileFormat': fileFormat, 'objCoefs': objCoefs}
+
+	entries = []
+	for entry in parallel.mapWithVarData(_writeShard, shards, projState.varData, maxWorkers, taskKwargs):
+		entries.append(entry)
+
+		if rowCallback != None:
+			rowCallback(entry['rows'])
+
+	manifest = {
+		'format': fileFormat,
+		'compression': compression,
+		'groups': entries
+	}
+
+	manifestPath = str(Path(dirpath) / MANIFEST_NAME)
+	with open(manifestPath, 'w') as outFile:
+		json.dump(manifest, outFile, indent=4)
+
+	return manifestPath
+
+
+def _writeShard (shard: Tuple[str, models.SetupConstraintGroup], varData: models.VarsData, fileFormat: str, objCoefs: Dict[str, float]) -> Dict[str, Any]:
+	'''
+	Writes a single group's file, returning its manifest entry
+	'''
+	filepath, setup = shard
+	exportToFile(filepath, models.ProjectState(varData=varData, setupList=[setup]), fileFormat, objCoefs)
+
+	entry = {
+		'group': setup.namePrefix,
+		'file': Path(filepath).name,
+		'rows': proc.getNumConstraints(setup, varData),
+		'sha256': _hashFile(filepath)
+	}
+	if fileFormat == 'longcsv':
+		entry['sidecarFile'] = Path(getSidecarPath(filepath)).name
+		entry['sidecarSha256'] = _hashFile(getSidecarPath(filepath))
+
+	return entry
+
+
+def openOutputFile (filepath: str, compression: str = 'auto', newline: str = None) -> io.TextIOWrapper:
+	'''
+	Opens filepath for writing text, through a large write buffer.
+
+	compression is one of COMPRESSION_EXTENSIONS ('gzip', 'xz'), None for plain
+	text, or 'auto' to pick from the file's extension (eg: constraints.csv.gz)
+	'''
+	if compression == 'auto':
+		compression = _getCompressionFromPath(filepath)
+
+	if compression == 'gzip':
+		# Level 6 compresses nearly as well as 9, a lot faster
+		stream = gzip.open(filepath, 'wb', compresslevel=6)
+	elif compression == 'xz':
+		stream = lzma.open(filepath, 'wb')
+	elif compression == None:
+		stream = open(filepath, 'wb', buffering=0)
+	else:
+		raise ValueError(f'Unknown compression "{compression}"')
+
+	return io.TextIOWrapper(io.BufferedWriter(stream, WRITE_BUFFER_SIZE), newline=newline)
+
+
+def _getCompressionFromPath (filepath: str) -> str:
+	suffix = Path(filepath).suffix.lower()
+	for compression, extension in COMPRESSION_EXTENSIONS.items():
+		if suffix == extension:
+			return compression
+	return None
+
+
+def _getBaseName (filepath: str) -> str:
+	'''
+	File name without its extensions, eg: model.mps.gz -> model
+	'''
+	path = Path(filepath)
+	if _getCompressionFromPath(filepath) != None:
+		path = path.with_suffix('')
+	return path.stem
 
-				writer.writerow(newRow)
 
+def _hashFile (filepath: str) -> str:
+	fileHash = hashlib.sha256()
+	with open(filepath, 'rb') as inFile:
+		for chunk in iter(lambda: inFile.read(1 << 20), b''):
+			fileHash.update(chunk)
 
+	return fileHash.hexdigest()
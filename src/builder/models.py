@@ -11,8 +11,9 @@ NJDEP
 import json
 import attrs
 import cattrs
+from array import array
 from enum import Enum, unique, auto
-from typing import Any, List, Dict, Type, Union
+from typing import Any, Iterator, List, Dict, Tuple, Type, Union
 from copy import deepcopy
 
 
@@ -36,6 +37,16 @@ class ComparisonSign(Enum):
 	def exportName (self) -> str:
 		return _toExportName[self]
 
+	def toCode (self) -> int:
+		'''
+		Small integer for the sign, used by ConstraintMatrix
+		'''
+		return _toCode[self]
+
+	@staticmethod
+	def fromCode (code: int):
+		return _fromCode[code]
+
 	@staticmethod
 	def fromSybols (symbols: str):
 		stripped = symbols.strip()
@@ -54,6 +65,11 @@ _compSignMap = {}
 for cs in ComparisonSign:
 	_compSignMap[cs._value_] = cs
 
+_fromCode = list(ComparisonSign)
+_toCode = {}
+for code, cs in enumerate(_fromCode):
+	_toCode[cs] = code
+
 
 
 
@@ -67,6 +83,9 @@ class VarsData:
 	all_vars: List of variables, where variables are stored as lists of their tags
 	tag_members: Dictionary between a tag group (from tag_order) and which tags it has
 
+	A compact, integer-encoded copy of all_vars (EncodedVars) is built alongside
+	these fields on first use, see proc_varindex.getEncodedVars
+
 	== Example
 	variables = ['167N_PLSQ_2021', '167N_THNB_2021', '167N_PLSQ_2025']
 
@@ -89,6 +108,103 @@ class VarsData:
 
 
 
+@attrs.define
+class EncodedVars:
+	'''
+	A compact version of VarsData.all_vars. Instead of storing each variable
+	as a list of strings, every tag group gets a table of its tags and each variable
+	stores the position (code) of its tag in that table. Codes are kept in one
+	array per tag group, so a variable costs a few bytes per tag.
+
+	tag_tables: For each tag group (in tag_order), the list of its tags
+	codes: For each tag group (in tag_order), an array with one code per variable
+		(variables are in the same order as all_vars)
+
+	== Example
+	all_vars = [ ['167N', 'PLSQ', '2021'], ['167N', 'THNB', '2021'], ['167N', 'PLSQ', '2025'] ]
+
+	tag_tables = [ ['167N'], ['PLSQ', 'THNB'], ['2021', '2025'] ]
+	codes = [
+		array('B', [0, 0, 0]),
+		array('B', [0, 1, 0]),
+		array('B', [0, 0, 1])
+	]
+	'''
+	tag_tables: List[List[str]]
+	codes: List[array]
+
+	def numVars (self) -> int:
+		if len(self.codes) == 0:
+			return 0
+		return len(self.codes[0])
+
+	def decodeVar (self, varInd: int) -> List[str]:
+		return [self.tag_tables[g][col[varInd]] for g, col in enumerate(self.codes)]
+
+	@staticmethod
+	def fromVarsData (varData: 'VarsData'):
+		tagTables = [varData.tag_members[tagGroup] for tagGroup in varData.tag_order]
+
+		codes = []
+		for g, table in enumerate(tagTables):
+			tagToCode = {tag: code for code, tag in enumerate(table)}
+			codes.append(array(
+				smallestCodeType(len(table)),
+				[tagToCode[tags[g]] for tags in varData.all_vars]
+			))
+
+		return EncodedVars(
+			tag_tables=tagTables,
+			codes=codes
+		)
+
+
+def smallestCodeType (numCodes: int) -> str:
+	'''
+	Returns the smallest unsigned array typecode that can hold numCodes codes
+	'''
+	if numCodes <= 2**8:
+		return 'B'
+	if numCodes <= 2**16:
+		return 'H'
+	return 'L'
+
+
+
+@attrs.define
+class ParsedObjective:
+	'''
+	An objective file's variables after they've been read and checked, but
+	before the tag groups have been named (see proc_ingest).
+
+	delim: The seperating character
+	encoded: The variables, encoded. Tag tables are sorted (they're the tag lists
+		shown for naming) and variables are in the same order as VarsData.all_vars
+
+	== Example
+	variables = ['167N_PLSQ_2021', '167N_THNB_2021']
+
+	delim = '_'
+	encoded.tag_tables = [ ['167N'], ['PLSQ', 'THNB'], ['2021'] ]
+	'''
+	delim: str
+	encoded: EncodedVars
+
+	def numVars (self) -> int:
+		return self.encoded.numVars()
+
+	def tagLists (self) -> List[List[str]]:
+		return self.encoded.tag_tables
+
+	def iterNames (self) -> Iterator[str]:
+		'''
+		Yields every variable's full name (tags joined by delim)
+		'''
+		columns = [[table[code] for code in col] for table, col in zip(self.encoded.tag_tables, self.encoded.codes)]
+		for tags in zip(*columns):
+			yield self.delim.join(tags)
+
+
 
 
 
@@ -135,6 +251,229 @@ class ConstraintGroup:
 	DEFAULT_RIGHT_COEF: float
 
 
+@attrs.define
+class ConstraintMatrix:
+	'''
+	A built constraint group stored as a sparse matrix, in compressed sparse row
+	(CSR) form. Each equation is one row, and the left and right coefficients of
+	a variable are merged into one (left - right), same as the exported .csv.
+
+	colNames: Variable names for each column, in exported order. Shared between
+		matrices built from the same varData, so don't modify it
+	rowNames: Full name of each equation
+	rowStarts: Where each row starts in colInds / coefs. Row i's entries are at
+		rowStarts[i] up to rowStarts[i+1], so there is one more than there are rows
+	colInds: Column of each entry, increasing within a row
+	coefs: Coefficient of each entry, never 0 (coefficients which cancel out are left out)
+	ops: Comparison of each row, as ComparisonSign codes (ComparisonSign.toCode)
+	rhs: Constant of each row, kept as given in the setup (eg: 0 stays an int,
+		so it gets written out the same as it always was)
+
+	== Example
+	unnamed_167N: 2*167N_2021 + 2*167N_2025 == 167N_2050 + 10
+	unnamed_167S: 2*167S_2021 == 10
+
+	colNames = ['167N_2021', '167N_2025', '167N_2050', '167S_2021']
+	rowNames = ['unnamed_167N', 'unnamed_167S']
+	rowStarts = array('L', [0, 3, 4])
+	colInds = array('L', [0, 1, 2, 3])
+	coefs = array('d', [2.0, 2.0, -1.0, 2.0])
+	ops = array('b', [2, 2])
+	rhs = [10, 10]
+	'''
+	colNames: List[str]
+	rowNames: List[str]
+	rowStarts: array
+	colInds: array
+	coefs: array
+	ops: array
+	rhs: List[float]
+
+	def numRows (self) -> int:
+		return len(self.rowNames)
+
+	def numNonzeros (self) -> int:
+		return len(self.colInds)
+
+	def getRow (self, rowInd: int) -> Tuple[array, array]:
+		'''
+		Returns the column indices and coefficients of a row
+		'''
+		start = self.rowStarts[rowInd]
+		end = self.rowStarts[rowInd + 1]
+		return self.colInds[start:end], self.coefs[start:end]
+
+	def extend (self, other: 'ConstraintMatrix') -> None:
+		'''
+		Appends the rows of other onto this matrix. Both need the same columns
+		'''
+		offset = len(self.colInds)
+
+		self.rowNames.extend(other.rowNames)
+		self.rowStarts.extend([start + offset for start in other.rowStarts[1:]])
+		self.colInds.extend(other.colInds)
+		self.coefs.extend(other.coefs)
+		self.ops.extend(other.ops)
+		self.rhs.extend(other.rhs)
+
+	def toColumnForm (self) -> Tuple[array, array, array]:
+		'''
+		Returns the matrix in compressed sparse column (CSC) form, as
+		(colStarts, rowInds, coefs). Column j's entries are at colStarts[j]
+		up to colStarts[j+1], in increasing row order.
+		'''
+		numCols = len(self.colNames)
+		numNonzeros = self.numNonzeros()
+
+		colStarts = array('L', [0]) * (numCols + 1)
+		for col in self.colInds:
+			colStarts[col + 1] += 1
+		for col in range(numCols):
+			colStarts[col + 1] += colStarts[col]
+
+		# Walking the rows in order keeps each column's rows increasing
+		nextPos = array('L', colStarts[:-1])
+		rowInds = array('L', [0]) * numNonzeros
+		colCoefs = array('d', [0.0]) * numNonzeros
+		for row in range(self.numRows()):
+			for ind in range(self.rowStarts[row], self.rowStarts[row + 1]):
+				col = self.colInds[ind]
+				pos = nextPos[col]
+				rowInds[pos] = row
+				colCoefs[pos] = self.coefs[ind]
+				nextPos[col] = pos + 1
+
+		return colStarts, rowInds, colCoefs
+
+	@staticmethod
+	def createEmpty (colNames: List[str]):
+		return ConstraintMatrix(
+			colNames=colNames,
+			rowNames=[],
+			rowStarts=array('L', [0]),
+			colInds=array('L'),
+			coefs=array('d'),
+			ops=array('b'),
+			rhs=[]
+		)
+
+
+@attrs.frozen
+class ConstraintCounts:
+	'''
+	The size of the constraint group a SetupConstraintGroup would generate.
+	Computed without building any equations (see proc_constraints.countConstraints)
+
+	numEquations: How many equations, aka constraints
+	numLeftNonzeros: How many variables show up on the left, summed over all equations
+	numRightNonzeros: How many variables show up on the right, summed over all equations
+	'''
+	numEquations: int
+	numLeftNonzeros: int
+	numRightNonzeros: int
+
+
+@attrs.frozen
+class TagMove:
+	'''
+	A single change to the selected tags of a SetupConstraintGroup.
+	Eg: "tag 167N added to for_type on the left side"
+
+	tagGroup: Which tag group the tag belongs to
+	tag: The tag being moved
+	onLeft: True for the left side, False for the right side
+	added: True if the tag is being selected, False if it is being unselected
+	'''
+	tagGroup: str
+	tag: str
+	onLeft: bool
+	added: bool
+
+
+@attrs.frozen
+class ExportProgress:
+	'''
+	How far along an export is (see io_export.ExportJob)
+
+	rowsWritten: Constraints written so far
+	rowsTotal: Constraints there will be once it's done
+	bytesWritten: Size of the (partial) file on disk so far
+	'''
+	rowsWritten: int
+	rowsTotal: int
+	bytesWritten: int
+
+
+@unique
+class LintCategory(Enum):
+	'''
+	Kinds of problems with variable names, in the order they get reported
+	'''
+	NO_VARIABLES = auto()
+	DELIMITER = auto()
+	INVALID_TAG = auto()
+	NUM_GROUPS = auto()
+
+
+@attrs.frozen
+class LintIssue:
+	'''
+	A single problem found while linting variable names
+
+	row: Row of the variable in the objective file (the header is row 1),
+		None for problems that aren't about a single variable
+	'''
+	category: LintCategory
+	row: int
+	message: str
+
+
+@attrs.define
+class LintReport:
+	'''
+	Every problem found with a list of variable names (see proc_linting.lintAllVarNamesReport)
+
+	issues: The problems, in the order they were found. Only the first few of each
+		category are kept
+	counts: Dictionary between a category and how many problems of it were found,
+		including ones that weren't kept
+	'''
+	issues: List[LintIssue] = attrs.Factory(list)
+	counts: Dict[LintCategory, int] = attrs.Factory(dict)
+
+	def isClean (self) -> bool:
+		return len(self.issues) == 0
+
+	def firstError (self) -> str:
+		'''
+		Returns the message of the most important problem, or None if there aren't any
+		'''
+		for category in LintCategory:
+			for issue in self.issues:
+				if issue.category == category:
+					return issue.message
+		return None
+
+	def toErrorStr (self) -> str:
+		'''
+		Returns every problem kept, one per line, or None if there aren't any
+		'''
+		if self.isClean():
+			return None
+
+		lines = []
+		for category in LintCategory:
+			categoryIssues = [issue for issue in self.issues if issue.category == category]
+			for issue in categoryIssues:
+				lines.append(issue.message if issue.row == None else f"Row {issue.row}: {issue.message}")
+
+			numHidden = self.counts.get(category, 0) - len(categoryIssues)
+			if numHidden > 0:
+				lines.append(f"  ... and {numHidden} more like this")
+
+		return "\n".join(lines)
+
+
 @attrs.define
 class SetupConstraintGroup:
 	'''
@@ -0,0 +1,62 @@
+'''
+Variable Bitsets
+
+Sets of variables stored as the bits of a python int, where bit i is set
+when the variable with id i (its position in all_vars) is in the set.
+
+Unions are |, intersections are & and complements are & ~, and python
+works through them a machine word (64 variables) at a time.
+'''
+
+from typing import Iterable, List
+
+
+
+def fromIds (varIds: Iterable[int], numVars: int) -> int:
+	'''
+	Returns the bitset with the bits of varIds set
+	'''
+	bits = bytearray((numVars + 7) // 8)
+	for varId in varIds:
+		bits[varId >> 3] |= 1 << (varId & 7)
+
+	return int.from_bytes(bits, 'little')
+
+
+def allVars (numVars: int) -> int:
+	'''
+	Returns the bitset with every variable in it
+	'''
+	return (1 << numVars) - 1
+
+
+def toIds (bits: int, limit: int = None) -> List[int]:
+	'''
+	Returns the ids in the bitset, in increasing order. Stops after
+	limit ids, when it's given.
+	'''
+	# Lowest bit first
+	binStr = bin(bits)[:1:-1]
+
+	varIds = []
+	ind = binStr.find('1')
+	while ind != -1 and (limit == None or len(varIds) < limit):
+		varIds.append(ind)
+		ind = binStr.find('1', ind + 1)
+
+	return varIds
+
+
+# int.bit_count() only exists from python 3.10
+if hasattr(int, 'bit_count'):
+	def popcount (bits: int) -> int:
+		'''
+		Returns how many variables are in the bitset
+		'''
+		return bits.bit_count()
+else:
+	def popcount (bits: int) -> int:
+		'''
+		Returns how many variables are in the bitset
+		'''
+		return bin(bits).count('1')
@@ -0,0 +1,71 @@
+'''
+Processor Cache
+
+A small least-recently-used cache, used to hold on to results which are
+expensive to build and get asked for repeatedly (eg: the same constraint
+group is built by the overview, the preview, and exporting).
+
+The cache is bounded by the total estimated size of what it holds,
+rather than the number of entries.
+
+It's safe to use from more than one thread (eg: an export job building groups
+while the GUI redraws).
+'''
+
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+
+class LRUCache:
+	'''
+	maxSize: Largest total size allowed. An entry bigger than this never gets stored
+	'''
+
+	def __init__(self, maxSize: int):
+		self.maxSize = maxSize
+		self.totalSize = 0
+		self._entries: OrderedDict = OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def __contains__(self, key: Hashable) -> bool:
+		return key in self._entries
+
+	def get(self, key: Hashable, default: Any = None) -> Any:
+		'''
+		Returns the value for key (or default) and marks it as most recently used
+		'''
+		with self._lock:
+			if key not in self._entries:
+				return default
+
+			self._entries.move_to_end(key)
+			return self._entries[key][0]
+
+	def put(self, key: Hashable, value: Any, size: int = 1) -> None:
+		'''
+		Stores the value, evicting the least recently used entries until it fits.
+		'''
+		with self._lock:
+			if key in self._entries:
+				self.totalSize -= self._entries.pop(key)[1]
+
+			size = max(size, 1)
+			if size > self.maxSize:
+				return
+
+			while self.totalSize + size > self.maxSize:
+				_, (_, evictedSize) = self._entries.popitem(last=False)
+				self.totalSize -= evictedSize
+
+			self._entries[key] = (value, size)
+			self.totalSize += size
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+			self.totalSize = 0
@@ -13,13 +13,21 @@ Started 05/21/2022
 '''
 
 from copy import deepcopy
-from typing import List, Dict, Union
+from typing import Iterator, List, Dict, Tuple, Union
+import hashlib
 import itertools
+import json
+
+import cattrs
 
 import builder.models as models
 import builder.io_cmd as io_cmd
 import builder.io_file as io_file
+import builder.proc_bitset as bitset
+import builder.proc_cache as cache
 import builder.proc_linting as lint
+import builder.proc_npbackend as npbackend
+import builder.proc_varindex as varindex
 
 
 # TODO:
@@ -29,12 +37,31 @@ import builder.proc_linting as lint
 # [x] Have dataclass for constraint classes
 #    - There should be a sense of an abstract constraint class (group members)
 #      and a concrete constraint class (which can be exactly compiled into constraints)
-# [ ] Instead of returning lists of copmiled constraints, return an iterator or generator function
+# [x] Instead of returning lists of copmiled constraints, return an iterator or generator function
 # [ ] Have a way to be Exclusive or Inclusive with categories ??
 #    - We may want a constriant that for example applies to all but 2 tree species, and this would allow
 #      for generalizing the scripts for other obj inputs (other states ?)
 # [ ] Add type checks for important processing functions
 
+# The same groups get built over and over (overview, preview, exporting), so
+# split buckets, counts, etc get cached. Sizes are roughly in stored variables.
+MAX_CACHED_VARS = 5_000_000
+_buildCache = cache.LRUCache(MAX_CACHED_VARS)
+
+
+def fingerprintSetup (setup: models.SetupConstraintGroup) -> str:
+	'''
+	Returns a hash of everything in the setup object. Two setups with the
+	same fingerprint generate the same constraints (for the same varData).
+	'''
+	setupStr = json.dumps(cattrs.unstructure(setup), sort_keys=True)
+	return hashlib.sha1(setupStr.encode()).hexdigest()
+
+
+def _getCacheKey (kind: str, setup: models.SetupConstraintGroup, varData: models.VarsData) -> Tuple[str, str, int]:
+	return (kind, fingerprintSetup(setup), varindex.getVersionToken(varData))
+
+
 def makeTagGroupMembersList (varnamesRaw: List[str], delim: str) -> List[List[str]]:
 	'''
 		Takes a list of variables in the form
@@ -90,94 +117,430 @@ def buildVarDataObject (varnamesRaw: List[str], delim: str, tagGroupNames: List[
 	)
 
 
-def buildConstraintGroup (groupSetup: models.SetupConstraintGroup, varData: models.VarsData) -> models.ConstraintGroup:
+def findSelectedVars (selTags: Dict[str, List[str]], varData: models.VarsData, sparse: bool = None) -> List[List[str]]:
 	'''
-	Generates a constraint group, which holds the actual equations, from the 
-	specification of a SetupConstraintGroup.
+	Returns every existing variable whose tags are all selected in selTags, in the
+	same order as itertools.product over the selections would generate them.
 
-	Takes a setup object (SetupConstraintGroup), and a varData object.
+	See _findSelectedTuples for how they're found.
 	'''
-	# I apologize to future me if I ever have to refactor this, this is a tad convoluted ...
-	delim: str = varData.delim
+	return [list(tags) for tags in _findSelectedTuples(selTags, varData, sparse)]
 
-	# Generate all applicable variables
-	allLeftVars: List[List[str]] = []
-	allRightVars: List[List[str]] = []
 
-	leftSelAsList = [groupSetup.selLeftTags[k] for k in varData.tag_order]
-	for tags in itertools.product(*leftSelAsList):
-		allLeftVars.append(list(tags))
+def _findSelectedTuples (selTags: Dict[str, List[str]], varData: models.VarsData, sparse: bool = None, ordered: bool = True) -> List[Tuple[str, ...]]:
+	'''
+	Same as findSelectedVars, but variables are the index's tuples. When ordered is
+	False the variables come back in any order, which saves a sort for counting.
 
-	rightSelAsList = [groupSetup.selRightTags[k] for k in varData.tag_order]
-	for tags in itertools.product(*rightSelAsList):
-		allRightVars.append(list(tags))
+	There are two ways of finding them
+	 - dense (sparse=False): walk the cartesian product of the selected tags
+		and keep the combinations which exist
+	 - sparse (sparse=True): OR together the bitsets of the selected tags in each
+		tag group, and AND the tag groups together. Cost scales with the number
+		of variables (a word at a time) rather than the size of the product
 
-	# Now split them into seperate equations
-	allSelectedVars: List[List[str]] = deepcopy(leftSelAsList)
-	for ind, _ in enumerate(varData.tag_order):
-		for mem in rightSelAsList[ind]:
-			if mem not in allSelectedVars[ind]:
-				allSelectedVars[ind].append(mem)
-	
-	allSelectedSplits: List[List[str]] = []
+	When sparse is None, whichever is cheaper gets picked.
+	'''
+	index = varindex.getVarIndex(varData)
+	selAsList = [selTags[k] for k in varData.tag_order]
+
+	productSize = 1
+	for sel in selAsList:
+		productSize *= len(sel)
+	if productSize == 0:
+		return []
+
+	# Repeated tags make the product repeat variables, which only the dense walk reproduces
+	hasRepeats = any([len(set(sel)) != len(sel) for sel in selAsList])
+
+	selCodes = _getSelCodes(selTags, varData)
+
+	# Big tables get filtered with vectorized masks when NumPy is around
+	if sparse == None and not hasRepeats and npbackend.shouldUse(index):
+		varIds = npbackend.findSelectedIds(index, selCodes, ordered)
+		return [index.varTuples[varId] for varId in varIds.tolist()]
+
+	if sparse == None:
+		# Each bitset operation handles 64 variables at once
+		numTags = sum([len(codes) for codes in selCodes])
+		sparse = numTags * (index.encoded.numVars() // 64 + 1) < productSize
+	if hasRepeats:
+		sparse = False
+
+	if not sparse:
+		return [tags for tags in itertools.product(*selAsList) if tags in index.varIds]
+
+	matches = bitset.toIds(_getSelectionBitset(selCodes, varData))
+
+	if ordered:
+		# Position of each code in its selection, so results can be put in product order
+		selRanks: List[Dict[int, int]] = []
+		for codes in selCodes:
+			selRanks.append({code: rank for rank, code in enumerate(codes)})
+
+		codeCols = index.encoded.codes
+		matches.sort(key=lambda varId: [selRanks[ind][col[varId]] for ind, col in enumerate(codeCols)])
+
+	return [index.varTuples[varId] for varId in matches]
+
+
+def _getSelectionBitset (selCodes: List[List[int]], varData: models.VarsData) -> int:
+	'''
+	Returns the bitset of the variables selected by selCodes (see _getSelCodes).
+	Tags are ORed together within a tag group, and tag groups are ANDed together.
+	'''
+	index = varindex.getVarIndex(varData)
+
+	selBits = bitset.allVars(index.encoded.numVars())
+	for tagGroup, codes in zip(varData.tag_order, selCodes):
+		groupBits = 0
+		for code in codes:
+			groupBits |= index.getTagBitset(tagGroup, code)
+
+		selBits &= groupBits
+		if selBits == 0:
+			break
+
+	return selBits
+
+
+def countVarsPerTag (selTags: Dict[str, List[str]], varData: models.VarsData, tagGroup: str) -> Dict[str, int]:
+	'''
+	For every member of tagGroup, returns how many variables with that tag are selected
+	by the other tag groups in selTags. For a selected tag, that's how many variables
+	it brings in, for the rest it's how many would come in if it was selected.
+	'''
+	index = varindex.getVarIndex(varData)
+	groupInd = varData.tag_order.index(tagGroup)
+
+	# Every tag of tagGroup is "selected", so only the other groups filter
+	selCodes = _getSelCodes(selTags, varData)
+	selCodes[groupInd] = list(range(len(index.encoded.tag_tables[groupInd])))
+	otherBits = _getSelectionBitset(selCodes, varData)
+
+	tagCounts: Dict[str, int] = {}
+	for code, tag in enumerate(index.encoded.tag_tables[groupInd]):
+		tagCounts[tag] = bitset.popcount(otherBits & index.getTagBitset(tagGroup, code))
+
+	return tagCounts
+
+
+def _getSelCodes (selTags: Dict[str, List[str]], varData: models.VarsData) -> List[List[int]]:
+	'''
+	Selections as tag codes, for each tag group in tag_order.
+	Tags which don't exist in varData can't match anything, so they get dropped.
+	'''
+	index = varindex.getVarIndex(varData)
+
+	selCodes: List[List[int]] = []
+	for ind, tagGroup in enumerate(varData.tag_order):
+		tagToCode = index.tagCodes[ind]
+		selCodes.append([tagToCode[tag] for tag in selTags[tagGroup] if tag in tagToCode])
+
+	return selCodes
+
+
+def _hasRepeatedTags (groupSetup: models.SetupConstraintGroup) -> bool:
+	'''
+	Whether any tag is selected more than once on the same side of the setup
+	'''
+	allSels = list(groupSetup.selLeftTags.values()) + list(groupSetup.selRightTags.values())
+	return any([len(set(sel)) != len(sel) for sel in allSels])
+
+
+def _getSplitInds (groupSetup: models.SetupConstraintGroup, varData: models.VarsData) -> List[int]:
+	'''
+	Positions (within a variable's tags) of the tag groups being split by
+	'''
+	splitInds: List[int] = []
 	for ind, tagGroup in enumerate(varData.tag_order):
 		if tagGroup in groupSetup.splitBy:
-			allSelectedSplits.append(allSelectedVars[ind])
+			splitInds.append(ind)
+	return splitInds
+
+
+def _getSplitTagPositions (groupSetup: models.SetupConstraintGroup, varData: models.VarsData, splitInds: List[int]) -> List[Dict[str, List[int]]]:
+	'''
+	For each split tag group, where each tag shows up in the selections. Splits
+	are ordered by these positions, left side first, then anything only selected
+	on the right.
+
+	A tag selected twice makes the same split show up twice, so a split is
+	emitted once per combination of positions its tags appear at.
+	'''
+	tagPositions: List[Dict[str, List[int]]] = []
+
+	for ind in splitInds:
+		tagGroup = varData.tag_order[ind]
+		allSelected: List[str] = deepcopy(groupSetup.selLeftTags[tagGroup])
+		for mem in groupSetup.selRightTags[tagGroup]:
+			if mem not in allSelected:
+				allSelected.append(mem)
+
+		positions = {}
+		for pos, tag in enumerate(allSelected):
+			positions.setdefault(tag, []).append(pos)
+		tagPositions.append(positions)
+
+	return tagPositions
+
+
+def splitSelectedVars (groupSetup: models.SetupConstraintGroup, varData: models.VarsData) -> List[Tuple[Tuple[str, ...], List[List[str]], List[List[str]]]]:
+	'''
+	Finds the selected variables on both sides, and partitions them into splits
+	using their splitBy tags. Each split becomes one equation.
+
+	Returns a list of (splitTags, leftVars, rightVars) for every non-empty split, in
+	the order equations are generated. splitTags holds only the splitBy tags, eg:
+	('167N', '2025') when splitting by ['for_type', 'year'].
+
+	Variables are varData.all_vars' own lists rather than copies, so a variable
+	showing up in lots of equations only exists once. Don't modify them.
+	'''
+	return [
+		(key, _toVarLists(leftVars, varData), _toVarLists(rightVars, varData))
+		for key, leftVars, rightVars in _splitSelectedTuples(groupSetup, varData)
+	]
+
+
+def _toVarLists (varTuples: List[Tuple[str, ...]], varData: models.VarsData) -> List[List[str]]:
+	'''
+	Swaps the index's tuples for varData.all_vars' own lists (see splitSelectedVars)
+	'''
+	varIds = varindex.getVarIndex(varData).varIds
+	allVars = varData.all_vars
+
+	return [allVars[varIds[var]] for var in varTuples]
+
+
+def _splitSelectedTuples (groupSetup: models.SetupConstraintGroup, varData: models.VarsData) -> List[Tuple[Tuple[str, ...], List[Tuple[str, ...]], List[Tuple[str, ...]]]]:
+	'''
+	Same as splitSelectedVars, but variables are the index's tuples.
+
+	Results are cached, so don't modify them.
+	'''
+	key = _getCacheKey('splits', groupSetup, varData)
+	splits = _buildCache.get(key)
+
+	if splits == None:
+		splits = _computeSplits(groupSetup, varData)
+		size = sum([len(leftVars) + len(rightVars) for _, leftVars, rightVars in splits])
+		_buildCache.put(key, splits, size + len(splits))
+
+	return splits
+
+
+def _computeSplits (groupSetup: models.SetupConstraintGroup, varData: models.VarsData) -> List[Tuple[Tuple[str, ...], List[Tuple[str, ...]], List[Tuple[str, ...]]]]:
+	splitInds = _getSplitInds(groupSetup, varData)
+	tagPositions = _getSplitTagPositions(groupSetup, varData, splitInds)
+	index = varindex.getVarIndex(varData)
+
+	# Big tables get bucketed with np.unique over the split code columns
+	if npbackend.shouldUse(index) and not _hasRepeatedTags(groupSetup):
+		buckets = _bucketWithNumpy(groupSetup, varData, splitInds)
+	else:
+		buckets = _bucketWithPython(groupSetup, varData, splitInds)
+
+	return _orderSplits(buckets, tagPositions)
+
+
+def _bucketWithPython (groupSetup: models.SetupConstraintGroup, varData: models.VarsData, splitInds: List[int], sparse: bool = None) -> Dict[Tuple[str, ...], Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]]:
+	'''
+	Puts the selected variables on both sides into buckets by their split tags.
+	sparse picks how they're selected, see _findSelectedTuples.
+	'''
+	actuallyAllLeftVars = _findSelectedTuples(groupSetup.selLeftTags, varData, sparse)
+	actuallyAllRightVars = _findSelectedTuples(groupSetup.selRightTags, varData, sparse)
+
+	# One pass over the variables puts each one into its split's bucket
+	buckets: Dict[Tuple[str, ...], Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]] = {}
+	for var in actuallyAllLeftVars:
+		key = tuple([var[ind] for ind in splitInds])
+		if key not in buckets:
+			buckets[key] = ([], [])
+		buckets[key][0].append(var)
+	for var in actuallyAllRightVars:
+		key = tuple([var[ind] for ind in splitInds])
+		if key not in buckets:
+			buckets[key] = ([], [])
+		buckets[key][1].append(var)
+
+	return buckets
+
+
+def _bucketWithNumpy (groupSetup: models.SetupConstraintGroup, varData: models.VarsData, splitInds: List[int]) -> Dict[Tuple[str, ...], Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]]:
+	'''
+	Same buckets as _bucketWithPython, built with the NumPy backend
+	'''
+	index = varindex.getVarIndex(varData)
+	tagTables = index.encoded.tag_tables
+
+	buckets: Dict[Tuple[str, ...], Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]] = {}
+	for sideInd, selTags in enumerate([groupSetup.selLeftTags, groupSetup.selRightTags]):
+		varIds = npbackend.findSelectedIds(index, _getSelCodes(selTags, varData))
+
+		for codeKey, splitIds in npbackend.groupBySplit(index, varIds, splitInds).items():
+			key = tuple([tagTables[splitInds[ind]][code] for ind, code in enumerate(codeKey)])
+			if key not in buckets:
+				buckets[key] = ([], [])
+			buckets[key][sideInd].extend([index.varTuples[varId] for varId in splitIds.tolist()])
+
+	return buckets
+
+
+def _orderSplits (buckets: Dict[Tuple[str, ...], Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]], tagPositions: List[Dict[str, List[int]]]) -> List[Tuple[Tuple[str, ...], List[Tuple[str, ...]], List[Tuple[str, ...]]]]:
+	'''
+	Puts split buckets into the order their equations get generated
+	'''
+	orderedSplits = []
+	for key in buckets.keys():
+		keyPositions = [tagPositions[ind][tag] for ind, tag in enumerate(key)]
+		for pos in itertools.product(*keyPositions):
+			orderedSplits.append((pos, key))
+	orderedSplits.sort(key=lambda posAndKey: posAndKey[0])
+
+	return [(key, buckets[key][0], buckets[key][1]) for _, key in orderedSplits]
+
+
+def applyTagMove (groupSetup: models.SetupConstraintGroup, varData: models.VarsData, move: models.TagMove) -> None:
+	'''
+	Adds or removes a single selected tag in groupSetup (modifying it), and updates
+	the cached build of the group to match.
+
+	Only the variables with the moved tag are looked at, and only the splits
+	they fall into get changed, so this is much cheaper than a full rebuild.
+	If the group was never built, nothing gets rebuilt until it's next needed.
+	'''
+	selTags = groupSetup.selLeftTags if move.onLeft else groupSetup.selRightTags
+	prevSplits = _buildCache.get(_getCacheKey('splits', groupSetup, varData))
+	hadRepeats = _hasRepeatedTags(groupSetup)
+
+	if move.added:
+		selTags[move.tagGroup].append(move.tag)
+	elif move.tag in selTags[move.tagGroup]:
+		selTags[move.tagGroup].remove(move.tag)
+	else:
+		return
+
+	# Repeated tags repeat splits, which only a full rebuild gets right. That goes
+	# for the build being patched too (eg: unselecting one of a tag picked twice
+	# leaves its variables where they were)
+	if prevSplits == None or hadRepeats or _hasRepeatedTags(groupSetup):
+		return
+
+	groupInd = varData.tag_order.index(move.tagGroup)
+	splitInds = _getSplitInds(groupSetup, varData)
+	tagPositions = _getSplitTagPositions(groupSetup, varData, splitInds)
+	sideInd = 0 if move.onLeft else 1
+
+	# The variables which are entering or leaving this side
+	movedVars = _findVarsWithTag(selTags, varData, groupInd, move.tag)
+
+	movedPerSplit: Dict[Tuple[str, ...], List[Tuple[str, ...]]] = {}
+	for var in movedVars:
+		movedPerSplit.setdefault(tuple([var[ind] for ind in splitInds]), []).append(var)
+
+	# Unchanged splits are shared with the previous build, changed ones are copied
+	buckets = {}
+	for key, leftVars, rightVars in prevSplits:
+		buckets[key] = (leftVars, rightVars)
+
+	selRanks = [{tag: rank for rank, tag in enumerate(selTags[tagGroup])} for tagGroup in varData.tag_order]
+
+	for key, changedVars in movedPerSplit.items():
+		sides = [list(side) for side in buckets.get(key, ([], []))]
+
+		if move.added:
+			sides[sideInd].extend(changedVars)
+			sides[sideInd].sort(key=lambda var: [selRanks[ind][tag] for ind, tag in enumerate(var)])
 		else:
-			allSelectedSplits.append([None])
-
-	actuallyAllLeftVars: List[List[str]] = []
-	actuallyAllRightVars: List[List[str]] = []
-	for tags in itertools.product(*leftSelAsList):
-		if list(tags) in varData.all_vars:
-			actuallyAllLeftVars.append(list(tags))
-	for tags in itertools.product(*rightSelAsList):
-		if list(tags) in varData.all_vars:
-			actuallyAllRightVars.append(list(tags))
-
-	eqList: List[models.Equation] = []
-
-	for split in itertools.product(*allSelectedSplits):
-		leftsideVars = []
-		rightsideVars = []
-
-		for x in actuallyAllLeftVars:
-			if all([split[ind] == None or split[ind] == y 
-				for ind, y in enumerate(x)]):
-					leftsideVars.append(x)
-
-		for x in actuallyAllRightVars:
-			if all([split[ind] == None or split[ind] == y
-				for ind, y in enumerate(x)]):
-					rightsideVars.append(x)
-
-		# Check if it's an empty constraint
-		if len(leftsideVars) == 0 and len(rightsideVars) == 0:
-			continue
-		
-		# Now we can construct the equation
-		suffix = None
-		if all([x == [None] for x in allSelectedSplits]):
-			suffix = ''
+			changedSet = set(changedVars)
+			sides[sideInd] = [var for var in sides[sideInd] if var not in changedSet]
+
+		if len(sides[0]) == 0 and len(sides[1]) == 0:
+			buckets.pop(key, None)
 		else:
-			suffix = delim.join(filter(lambda mem: mem != None, split))
-
-		eqList.append(
-			models.Equation(
-				namePrefix=groupSetup.namePrefix,
-				nameSuffix=suffix,
-				constant=groupSetup.defConstant,
-				comparison=groupSetup.defComp,
-				leftVars=leftsideVars,
-				leftCoefs=[groupSetup.defLeftCoef] * len(leftsideVars),
-				rightVars=rightsideVars,
-				rightCoefs=[groupSetup.defRightCoef] * len(rightsideVars)
-			)
+			buckets[key] = (sides[0], sides[1])
+
+	splits = _orderSplits(buckets, tagPositions)
+	size = sum([len(leftVars) + len(rightVars) for _, leftVars, rightVars in splits])
+	_buildCache.put(_getCacheKey('splits', groupSetup, varData), splits, size + len(splits))
+
+
+def _findVarsWithTag (selTags: Dict[str, List[str]], varData: models.VarsData, groupInd: int, tag: str) -> List[Tuple[str, ...]]:
+	'''
+	Returns the variables which have the tag (in the tag group at groupInd), and
+	which are selected by selTags in every other tag group. Not in any particular order.
+	'''
+	index = varindex.getVarIndex(varData)
+
+	code = index.tagCodes[groupInd].get(tag)
+	if code == None:
+		return []
+
+	otherGroups = []
+	for ind, tagGroup in enumerate(varData.tag_order):
+		if ind == groupInd:
+			continue
+		tagToCode = index.tagCodes[ind]
+		selCodes = set([tagToCode[t] for t in selTags[tagGroup] if t in tagToCode])
+		otherGroups.append((index.encoded.codes[ind], selCodes))
+
+	postings = index.tagPostings[varData.tag_order[groupInd]].get(code, [])
+	return [
+		index.varTuples[varId] for varId in postings
+		if all(col[varId] in selCodes for col, selCodes in otherGroups)
+	]
+
+
+def getConstraintName (namePrefix: str, nameSuffix: str, delim: str) -> str:
+	'''
+	The full name of an equation, as it gets exported. 
+	'''
+	if nameSuffix == '':
+		return namePrefix
+	return namePrefix + delim + nameSuffix
+
+
+def iterEquations (groupSetup: models.SetupConstraintGroup, varData: models.VarsData) -> Iterator[models.Equation]:
+	'''
+	Generates the equations of a constraint group one at a time, from the 
+	specification of a SetupConstraintGroup.
+
+	Use this over buildConstraintGroup when the equations only need to be 
+	looked at once (exporting, previews) so they never all sit in memory.
+
+	Equations share their variables with varData (see splitSelectedVars). Each
+	split's variables are only looked up once its equation is asked for.
+	'''
+	delim: str = varData.delim
+
+	for splitTags, leftTuples, rightTuples in _splitSelectedTuples(groupSetup, varData):
+		leftsideVars = _toVarLists(leftTuples, varData)
+		rightsideVars = _toVarLists(rightTuples, varData)
+
+		yield models.Equation(
+			namePrefix=groupSetup.namePrefix,
+			nameSuffix=delim.join(splitTags),
+			constant=groupSetup.defConstant,
+			comparison=groupSetup.defComp,
+			leftVars=leftsideVars,
+			leftCoefs=[groupSetup.defLeftCoef] * len(leftsideVars),
+			rightVars=rightsideVars,
+			rightCoefs=[groupSetup.defRightCoef] * len(rightsideVars)
 		)
 
+
+def buildConstraintGroup (groupSetup: models.SetupConstraintGroup, varData: models.VarsData) -> models.ConstraintGroup:
+	'''
+	Generates a constraint group, which holds the actual equations, from the 
+	specification of a SetupConstraintGroup.
+
+	Takes a setup object (SetupConstraintGroup), and a varData object.
+	'''
 	return models.ConstraintGroup(
 		groupName=groupSetup.namePrefix,
-		equations=eqList,
+		equations=list(iterEquations(groupSetup, varData)),
 		SPLIT_BY=groupSetup.splitBy,
 		DEFAULT_COMPARE=groupSetup.defComp,
 		DEFAULT_LEFT_COEF=groupSetup.defLeftCoef,
@@ -185,13 +548,147 @@ def buildConstraintGroup (groupSetup: models.SetupConstraintGroup, varData: mode
 	)
 
 
+def buildConstraintMatrix (groupSetup: models.SetupConstraintGroup, varData: models.VarsData, withColNames: bool = True) -> models.ConstraintMatrix:
+	'''
+	Builds the sparse matrix form (see models.ConstraintMatrix) of the constraint
+	group described by groupSetup. Goes straight from the split buckets, 
+	no Equation objects get made.
+
+	withColNames: When False, colNames is left as None so the variable names
+		never have to be made (eg: in pool workers, which send matrices back without them)
+	'''
+	delim: str = varData.delim
+	index = varindex.getVarIndex(varData)
+	opCode = groupSetup.defComp.toCode()
+
+	matrix = models.ConstraintMatrix.createEmpty(index.exportNames if withColNames else None)
+
+	for splitTags, leftVars, rightVars in _splitSelectedTuples(groupSetup, varData):
+		# Same variable on both sides gets merged into a single coefficient. A
+		# variable selected more than once (eg: a tag picked twice) still only
+		# counts once per side, same as the .csv always had it
+		rowCoefs: Dict[int, float] = {}
+		for col in {index.exportCol[var] for var in leftVars}:
+			rowCoefs[col] = groupSetup.defLeftCoef
+		for col in {index.exportCol[var] for var in rightVars}:
+			rowCoefs[col] = rowCoefs.get(col, 0.0) - groupSetup.defRightCoef
+
+		# Coefficients which cancel out (or were 0 to begin with) aren't stored,
+		# so the matrix only ever holds nonzeros
+		for col in sorted(rowCoefs.keys()):
+			if rowCoefs[col] == 0:
+				continue
+			matrix.colInds.append(col)
+			matrix.coefs.append(rowCoefs[col])
+		matrix.rowStarts.append(len(matrix.colInds))
+
+		matrix.rowNames.append(getConstraintName(groupSetup.namePrefix, delim.join(splitTags), delim))
+		matrix.ops.append(opCode)
+		matrix.rhs.append(groupSetup.defConstant)
+
+	return matrix
+
+
+def countConstraints (setup: models.SetupConstraintGroup, varData: models.VarsData) -> models.ConstraintCounts:
+	'''
+	Works out how many equations (and variables in them) the setup object
+	generates, using only the variable index. No equations get built.
+	'''
+	key = _getCacheKey('counts', setup, varData)
+	counts = _buildCache.get(key)
+	if counts != None:
+		return counts
+
+	# Already built groups can just be counted
+	splits = _buildCache.get(_getCacheKey('splits', setup, varData))
+	if splits != None:
+		counts = models.ConstraintCounts(
+			numEquations=len(splits),
+			numLeftNonzeros=sum([len(leftVars) for _, leftVars, _ in splits]),
+			numRightNonzeros=sum([len(rightVars) for _, _, rightVars in splits])
+		)
+	else:
+		counts = _computeCounts(setup, varData)
+
+	_buildCache.put(key, counts, 1)
+	return counts
+
+
+def getCachedCounts (setup: models.SetupConstraintGroup, varData: models.VarsData) -> models.ConstraintCounts:
+	'''
+	Returns the counts for the setup object if they've already been worked out, otherwise None
+	'''
+	return _buildCache.get(_getCacheKey('counts', setup, varData))
+
+
+def storeCachedCounts (setup: models.SetupConstraintGroup, varData: models.VarsData, counts: models.ConstraintCounts) -> None:
+	'''
+	Caches counts worked out somewhere else (eg: in another process)
+	'''
+	_buildCache.put(_getCacheKey('counts', setup, varData), counts, 1)
+
+
+def _computeCounts (setup: models.SetupConstraintGroup, varData: models.VarsData) -> models.ConstraintCounts:
+	splitInds = _getSplitInds(setup, varData)
+	tagPositions = _getSplitTagPositions(setup, varData, splitInds)
+
+	leftPerSplit: Dict[Tuple[str, ...], int] = {}
+	for var in _findSelectedTuples(setup.selLeftTags, varData, ordered=False):
+		key = tuple([var[ind] for ind in splitInds])
+		leftPerSplit[key] = leftPerSplit.get(key, 0) + 1
+
+	rightPerSplit: Dict[Tuple[str, ...], int] = {}
+	for var in _findSelectedTuples(setup.selRightTags, varData, ordered=False):
+		key = tuple([var[ind] for ind in splitInds])
+		rightPerSplit[key] = rightPerSplit.get(key, 0) + 1
+
+	numEquations = 0
+	numLeftNonzeros = 0
+	numRightNonzeros = 0
+	for key in set(leftPerSplit.keys()).union(rightPerSplit.keys()):
+		# Splits with repeated tags are emitted more than once
+		repeats = 1
+		for ind, tag in enumerate(key):
+			repeats *= len(tagPositions[ind][tag])
+
+		numEquations += repeats
+		numLeftNonzeros += repeats * leftPerSplit.get(key, 0)
+		numRightNonzeros += repeats * rightPerSplit.get(key, 0)
+
+	return models.ConstraintCounts(
+		numEquations=numEquations,
+		numLeftNonzeros=numLeftNonzeros,
+		numRightNonzeros=numRightNonzeros
+	)
+
+
 def getNumConstraints (setup: models.SetupConstraintGroup, varData: models.VarsData) -> int:
 	'''
 	Returns how many constraints exist in the setup object.
 
-	This is done by actually building the constriant group object.
+	This is counted from the variable index, without building the constraint group.
+	'''
+	return countConstraints(setup, varData).numEquations
+
+
+def findConstrainedBitset (setup: models.SetupConstraintGroup, varData: models.VarsData) -> int:
+	'''
+	Returns every variable that shows up in at least one of the setup's equations,
+	as a bitset of variable ids (see proc_bitset). Bitsets from several setups can
+	be ORed together.
 	'''
-	return len(buildConstraintGroup(setup, varData).equations)
+	key = _getCacheKey('constrained', setup, varData)
+	constrainedBits = _buildCache.get(key)
+
+	if constrainedBits == None:
+		constrainedBits = 0
+		for selTags in [setup.selLeftTags, setup.selRightTags]:
+			constrainedBits |= _getSelectionBitset(_getSelCodes(selTags, varData), varData)
+
+		numVars = varindex.getVarIndex(varData).encoded.numVars()
+		_buildCache.put(key, constrainedBits, numVars // 64)
+
+	return constrainedBits
 
 
 def changeVarsData (newVarData: models.VarsData, projectstate: models.ProjectState) -> models.ProjectState:
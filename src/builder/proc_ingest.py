@@ -0,0 +1,200 @@
+'''
+Objective File Ingestion
+
+Turns an objective file into variables in a single pass. Each name is
+read, checked, split and encoded as soon as it comes off the file, so the
+list of raw names (and the lists of split names) is never held in memory.
+Only the codes are kept, a few bytes per tag (see models.EncodedVars).
+
+Does the same job as
+	readVarnamesRaw -> lintAllVarNamesRaw -> makeTagGroupMembersList -> buildVarDataObject
+with the same results, but reports every bad variable rather than just the first.
+'''
+
+import csv
+import itertools
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import builder.io_cache as io_cache
+import builder.io_file as io_file
+import builder.models as models
+import builder.proc_linting as lint
+import builder.proc_varindex as varindex
+
+
+
+def ingestObjectiveFile (objCSVPath: Path, delim: str) -> Tuple[models.ParsedObjective, str]:
+	'''
+	Reads and checks every variable in the objective file. Returns (parsed, None), or
+	(None, errMsg) when there are bad variables. errMsg lists every problem in the file
+	(see lint.lintNumberedVarNamesReport), so they can all be fixed in one go.
+
+	Variables end up in the same order as buildVarDataObject puts them (sorted
+	by name). Files which are already sorted don't need any extra work, others
+	get sorted once everything is read.
+	'''
+	varNames = io_file.iterVarnamesRaw(objCSVPath)
+
+	# The first variable decides how many tag groups there are
+	firstVar = next(varNames, None)
+	if lint.lintAllVarNamesRaw([firstVar] if firstVar != None else [], delim) != None:
+		return None, _lintWholeFile(objCSVPath, delim)
+
+	numGroups = len(firstVar.split(delim))
+
+	# Checks the tags and how many there are at once
+	varRegex = lint.compileVarNameRegex(delim, numGroups)
+
+	# Codes are given out in the order tags are first seen, and sorted at the end
+	tagCodes: List[Dict[str, int]] = [{} for _ in range(numGroups)]
+	codes = [array('I') for _ in range(numGroups)]
+
+	isSorted = True
+	prevVar = firstVar
+
+	for var in itertools.chain([firstVar], varNames):
+		if varRegex.fullmatch(var) == None:
+			return None, _lintWholeFile(objCSVPath, delim)
+
+		if var < prevVar:
+			isSorted = False
+		prevVar = var
+
+		for groupCodes, groupCol, tag in zip(tagCodes, codes, var.split(delim)):
+			groupCol.append(groupCodes.setdefault(tag, len(groupCodes)))
+
+	order = None
+	if not isSorted:
+		order = _getSortedOrder(tagCodes, codes, delim)
+
+	tagTables = []
+	sortedCodes = []
+	for groupCodes, groupCol in zip(tagCodes, codes):
+		table = sorted(groupCodes)
+
+		remap = [0] * len(table)
+		for code, tag in enumerate(table):
+			remap[groupCodes[tag]] = code
+
+		if order == None:
+			newCol = [remap[code] for code in groupCol]
+		else:
+			newCol = [remap[groupCol[varInd]] for varInd in order]
+
+		tagTables.append(table)
+		sortedCodes.append(array(models.smallestCodeType(len(table)), newCol))
+
+	parsed = models.ParsedObjective(
+		delim=delim,
+		encoded=models.EncodedVars(
+			tag_tables=tagTables,
+			codes=sortedCodes
+		)
+	)
+	return parsed, None
+
+
+def ingestObjectiveFileCached (objCSVPath: Path, delim: str) -> Tuple[models.ParsedObjective, str]:
+	'''
+	Same as ingestObjectiveFile, but goes through the on-disk cache (see io_cache),
+	so a file which hasn't changed since it was last read isn't read again.
+	'''
+	result = io_cache.loadIngestResult(objCSVPath, delim)
+	if result != None:
+		return result
+
+	result = ingestObjectiveFile(objCSVPath, delim)
+	io_cache.saveIngestResult(objCSVPath, delim, result)
+
+	return result
+
+
+def _lintWholeFile (objCSVPath: Path, delim: str) -> str:
+	'''
+	Once a bad variable turns up, the whole file is linted to find every other one too
+	'''
+	return lint.lintNumberedVarNamesReport(io_file.iterNumberedVarnames(objCSVPath), delim).toErrorStr()
+
+
+def _getSortedOrder (tagCodes: List[Dict[str, int]], codes: List[array], delim: str) -> List[int]:
+	'''
+	Returns the positions of the variables, sorted by their names. Names
+	are rebuilt from the codes just for the sort.
+	'''
+	tables = [list(groupCodes) for groupCodes in tagCodes]
+	columns = [[table[code] for code in groupCol] for table, groupCol in zip(tables, codes)]
+	names = [delim.join(tags) for tags in zip(*columns)]
+	del columns
+
+	return sorted(range(len(names)), key=names.__getitem__)
+
+
+def buildVarData (parsed: models.ParsedObjective, tagGroupNames: List[str]) -> models.VarsData:
+	'''
+	Builds the varData object once the tag groups are named, same as buildVarDataObject.
+
+	Variables share their tag strings, rather than every variable having its own
+	copies, and the index (see proc_varindex) reuses the parsed codes.
+	'''
+	encoded = parsed.encoded
+
+	allVars = [list(tags) for tags in varindex.decodeVarTuples(encoded)]
+
+	varData = models.VarsData(
+		delim = parsed.delim,
+		tag_order = list(tagGroupNames),
+		all_vars = allVars,
+		tag_members = {name: encoded.tag_tables[ind] for ind, name in enumerate(tagGroupNames)}
+	)
+
+	varindex.getVarIndex(varData, encoded)
+
+	return varData
+
+
+
+class IngestJob:
+	'''
+	Runs ingestObjectiveFileCached on a background thread, so the import screens
+	don't freeze while a big file is read. Once isDone(), parsed and errMsg
+	hold what it returned.
+
+	== Example
+	job = IngestJob('obj.csv', '_')
+	job.start()
+	...
+	if job.isDone() and job.errMsg == None:
+		varData = buildVarData(job.parsed, tagGroupNames)
+	'''
+
+	def __init__(self, objCSVPath: Path, delim: str):
+		self.objCSVPath = objCSVPath
+		self.delim = delim
+
+		self.parsed: models.ParsedObjective = None
+		self.errMsg: str = None
+
+		self._done = False
+
+	def start(self) -> None:
+		threading.Thread(target=self.run, daemon=True).start()
+
+	def isDone(self) -> bool:
+		return self._done
+
+	def run(self) -> None:
+		'''
+		Reads the file on the calling thread
+		'''
+		try:
+			self.parsed, self.errMsg = ingestObjectiveFileCached(self.objCSVPath, self.delim)
+		except (OSError, UnicodeDecodeError, csv.Error) as e:
+			self.errMsg = f'Could not read "{self.objCSVPath}": {e}'
+		except Exception as e:
+			# Anything else would otherwise die with the thread, leaving no error to show
+			self.errMsg = f'Could not read "{self.objCSVPath}": {type(e).__name__}: {e}'
+		finally:
+			self._done = True
@@ -4,59 +4,163 @@ proc_linting.py
 This file contains functions that check data and user input
 for errors and warnings.
 '''
+from collections import Counter
 from copy import deepcopy
-from typing import List, Dict, Set
+from typing import Iterable, List, Dict, Set, Tuple
+import itertools
 import re
 import builder.models as models
 
 
 
+# Characters allowed to seperate the tags in variable names
+VALID_DELIMITERS = "_-= "
+
+# All tag members must be exclusively alphanumeric (A-Z, a-z, 0-9)
+TAG_MEMBER_CHARS = "[A-Za-z0-9]+"
+TAG_MEMBER_REGEX = f"^{TAG_MEMBER_CHARS}$"
+
+# Lint reports only keep this many problems of each kind
+MAX_ISSUES_PER_CATEGORY = 5
+
+# Row of the first variable in an objective file without blank lines, the header is row 1
+FIRST_VAR_ROW = 2
+
+
+
 def lintAllVarNamesRaw (varNamesRaw: List[str], delim: str) -> str:
 	'''
 	Goes through the list of variable names and checks that they're nice
 	 - returns None if there are no erors
-	 - returns an error message string if there are errors
+	 - returns an error message string if there are errors (the first one,
+	   lintAllVarNamesReport has all of them)
+	'''
+	return lintAllVarNamesReport(varNamesRaw, delim, maxPerCategory=1).firstError()
+
+
+def lintAllVarNamesReport (varNamesRaw: Iterable[str], delim: str, maxPerCategory: int = MAX_ISSUES_PER_CATEGORY) -> models.LintReport:
+	'''
+	Checks every variable name in a single pass, and reports every problem
+	found instead of stopping at the first one (see models.LintReport).
+
+	varNamesRaw can be any iterable, so the names don't all need to be in memory.
+	Rows are counted as if the names came straight from an objective file without
+	any blank lines, use lintNumberedVarNamesReport when the actual rows are known.
+	'''
+	varNames = varNamesRaw if varNamesRaw != None else []
+	return lintNumberedVarNamesReport(enumerate(varNames, start=FIRST_VAR_ROW), delim, maxPerCategory)
+
+
+def lintNumberedVarNamesReport (numberedVarNames: Iterable[Tuple[int, str]], delim: str, maxPerCategory: int = MAX_ISSUES_PER_CATEGORY) -> models.LintReport:
+	'''
+	Same as lintAllVarNamesReport, but takes (row, name) pairs (eg: from
+	io_file.iterNumberedVarnames) and reports problems at those rows.
 	'''
-	VALID_DELIMITERS = "_-= "
-	# All tag members must be exclusively alphanumeric (A-Z, a-z, 0-9)
-	TAG_MEMBER_REGEX = "^[A-Za-z0-9]+$"
+	report = models.LintReport()
 
+	numberedVars = iter(numberedVarNames)
+	firstNumbered = next(numberedVars, None)
 
 	# [[ Check ]] At least one variable
-	if (varNamesRaw == None or len(varNamesRaw) == 0):
-		return "Empty or None list passed in"
+	if firstNumbered == None:
+		_addIssue(report, maxPerCategory, models.LintCategory.NO_VARIABLES, None, "Empty or None list passed in")
+		return report
+
+	_, firstVar = firstNumbered
 
-	firstVar = varNamesRaw[0]
 
-	
 	# [[ Check ]] Delimiter is valid
+	delimErr = None
 	if len(delim) == 0:
-		return f'Empty delimiter is not allowed'
-	if len(delim) > 1:
-		return f'Delimiter must be a single character.'
-	if not (delim in VALID_DELIMITERS):
-		return f'Delimiter "{delim}" is invalid. It must be one of {",".join(VALID_DELIMITERS)}'
-
+		delimErr = f'Empty delimiter is not allowed'
+	elif len(delim) > 1:
+		delimErr = f'Delimiter must be a single character.'
+	elif not (delim in VALID_DELIMITERS):
+		delimErr = f'Delimiter "{delim}" is invalid. It must be one of {",".join(VALID_DELIMITERS)}'
 
 	# [[ Check ]] Delimiter is inside of variable
-	if not delim in firstVar:
-		return f'Delimiter "{delim}" not found inside variable {firstVar}'
+	elif not delim in firstVar:
+		delimErr = f'Delimiter "{delim}" not found inside variable {firstVar}'
 
+	if delimErr:
+		_addIssue(report, maxPerCategory, models.LintCategory.DELIMITER, None, delimErr)
+		return report
 
-	# [[ Check ]] All group names are valid
-	for var in varNamesRaw:
-		for tag in var.split(delim):
-			if re.search(TAG_MEMBER_REGEX, tag) == None:
-				return f'Found invalid groupname "{tag}" for variable "{var}". Groups must contain only letters and numbers'
 
-
-	# [[ Check ]] All variables have the same number of groups
 	numGroups = len(firstVar.split(delim))
 
-	for var in varNamesRaw[1:]:
-		testNumGroups = len(var.split(delim))
-		if testNumGroups != numGroups:
-			return f'Variable "{var}" has a different number of groups ({testNumGroups}) compare to "{firstVar}" ({numGroups})'
+	# Good variables pass this, so only bad ones need looking at tag by tag
+	varRegex = compileVarNameRegex(delim, numGroups)
+
+	for row, var in itertools.chain([firstNumbered], numberedVars):
+		if varRegex.fullmatch(var) != None:
+			continue
+
+		tags = var.split(delim)
+
+		# [[ Check ]] All group names are valid
+		for tag in tags:
+			if not (tag.isascii() and tag.isalnum()):
+				_addIssue(report, maxPerCategory, models.LintCategory.INVALID_TAG, row,
+					f'Found invalid groupname "{tag}" for variable "{var}". Groups must contain only letters and numbers')
+				break
+
+		# [[ Check ]] All variables have the same number of groups
+		if len(tags) != numGroups:
+			_addIssue(report, maxPerCategory, models.LintCategory.NUM_GROUPS, row,
+				f'Variable "{var}" has a different number of groups ({len(tags)}) compare to "{firstVar}" ({numGroups})')
+
+	return report
+
+
+def compileVarNameRegex (delim: str, numGroups: int) -> re.Pattern:
+	'''
+	Returns a regex which fully matches variable names with numGroups valid tags
+	seperated by delim, for checking a whole variable at once
+	'''
+	return re.compile(f"{TAG_MEMBER_CHARS}(?:{re.escape(delim)}{TAG_MEMBER_CHARS}){{{numGroups - 1}}}")
+
+
+def _addIssue (report: models.LintReport, maxPerCategory: int, category: models.LintCategory, row: int, message: str) -> None:
+	report.counts[category] = report.counts.get(category, 0) + 1
+	if report.counts[category] <= maxPerCategory:
+		report.issues.append(models.LintIssue(category=category, row=row, message=message))
+
+
+def guessDelimiter (varNamesRaw: List[str]) -> str:
+	'''
+	Guesses which of VALID_DELIMITERS seperates the tags, from a sample of the
+	variables (see io_file.readVarnamesSample). Returns None if none of them
+	show up in any variable.
+
+	Each delimiter is scored on
+	 - how many variables split into valid tags with it
+	 - then, how many variables split into the most common number of tags
+	 - then, how many tags that is (more is better)
+	'''
+	tagMemberRegex = re.compile(TAG_MEMBER_REGEX)
+
+	bestDelim = None
+	bestScore = None
+
+	for delim in VALID_DELIMITERS:
+		splitVars = [var.split(delim) for var in varNamesRaw if delim in var]
+		if len(splitVars) == 0:
+			continue
+
+		numValid = 0
+		for tags in splitVars:
+			if all([tagMemberRegex.search(tag) != None for tag in tags]):
+				numValid += 1
+
+		numTags, numVarsWithNumTags = Counter([len(tags) for tags in splitVars]).most_common(1)[0]
+
+		score = (numValid, numVarsWithNumTags, numTags)
+		if bestScore == None or score > bestScore:
+			bestDelim = delim
+			bestScore = score
+
+	return bestDelim
 
 
 def lintTagGroupName (tagName: str) -> str:
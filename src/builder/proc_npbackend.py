@@ -0,0 +1,92 @@
+'''
+NumPy Backend
+
+Vectorized versions of variable selection and split bucketing, working on
+the integer-encoded tag columns (see models.EncodedVars).
+
+NumPy is optional. When it isn't installed, isAvailable() is False and
+proc_constraints sticks to its pure python path.
+'''
+
+from typing import Dict, List, Tuple
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+import builder.proc_varindex as varindex
+
+
+# Below this many variables plain python is about as fast
+MIN_VARS_FOR_NUMPY = 20_000
+
+
+
+def isAvailable () -> bool:
+	return np != None
+
+
+def shouldUse (index: varindex.VarIndex) -> bool:
+	'''
+	Whether it's worth using NumPy for a table of this size
+	'''
+	return isAvailable() and index.encoded.numVars() >= MIN_VARS_FOR_NUMPY
+
+
+def _getCodeColumns (index: varindex.VarIndex) -> List['np.ndarray']:
+	# Views straight onto the arrays, nothing gets copied
+	return [np.frombuffer(col, dtype=col.typecode) for col in index.encoded.codes]
+
+
+def findSelectedIds (index: varindex.VarIndex, selCodes: List[List[int]], ordered: bool = True) -> 'np.ndarray':
+	'''
+	Returns the ids of variables whose codes are selected in every tag group.
+	selCodes has the selected codes for each tag group, in tag_order.
+
+	When ordered, ids are sorted by where their tags are in the selections
+	(the same order as itertools.product over the selections).
+	'''
+	codeCols = _getCodeColumns(index)
+
+	mask = np.ones(index.encoded.numVars(), dtype=bool)
+	for col, codes in zip(codeCols, selCodes):
+		mask &= np.isin(col, np.asarray(codes, dtype=col.dtype))
+	varIds = np.nonzero(mask)[0]
+
+	if ordered and len(varIds) > 1:
+		rankCols = []
+		for ind, (col, codes) in enumerate(zip(codeCols, selCodes)):
+			codeToRank = np.zeros(len(index.encoded.tag_tables[ind]), dtype=np.int64)
+			codeToRank[codes] = np.arange(len(codes))
+			rankCols.append(codeToRank[col[varIds]])
+
+		# lexsort sorts by the last key first
+		varIds = varIds[np.lexsort(rankCols[::-1])]
+
+	return varIds
+
+
+def groupBySplit (index: varindex.VarIndex, varIds: 'np.ndarray', splitInds: List[int]) -> Dict[Tuple[int, ...], 'np.ndarray']:
+	'''
+	Groups variable ids by their codes in the split tag groups (at splitInds).
+	Ids keep their relative order within each group.
+
+	Returns a dictionary between the split codes and the ids in that split.
+	'''
+	if len(varIds) == 0:
+		return {}
+	if len(splitInds) == 0:
+		return {(): varIds}
+
+	codeCols = _getCodeColumns(index)
+	splitCodes = np.stack([codeCols[ind][varIds] for ind in splitInds], axis=1)
+
+	keys, inverse = np.unique(splitCodes, axis=0, return_inverse=True)
+	inverse = inverse.reshape(-1)
+
+	order = np.argsort(inverse, kind='stable')
+	bounds = np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1]
+	groups = np.split(varIds[order], bounds)
+
+	return {tuple(key.tolist()): group for key, group in zip(keys, groups)}
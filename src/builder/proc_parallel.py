@@ -0,0 +1,282 @@
+'''
+Parallel Constraint Building
+
+Builds many constraint groups at once by spreading them across a pool of
+processes. Each worker gets the compact (integer-encoded) variable table
+once, when it starts, and then only receives setup objects.
+
+Results always come back in the same order as the setups passed in. If the
+pool can't be used (too few groups, or processes can't be started), everything
+is built one after another in this process instead.
+
+Each call gets its own pool, apart from counting for the GUI, which is done
+often enough that one pool is kept around between calls (see _getSharedPool).
+'''
+
+import atexit
+import concurrent.futures
+import os
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import builder.models as models
+import builder.proc_constraints as proc
+import builder.proc_varindex as varindex
+
+
+# Starting processes isn't free, so small projects are built serially
+MIN_GROUPS_FOR_POOL = 8
+
+
+
+#
+# Drivers
+#
+
+def iterConstraintMatrices (setupList: List[models.SetupConstraintGroup], varData: models.VarsData, maxWorkers: int = None) -> Iterator[models.ConstraintMatrix]:
+	'''
+	Yields the ConstraintMatrix of every setup, in order. Groups are built in
+	parallel, and each one is yielded as soon as it (and all before it) are done.
+	'''
+	colNames = varindex.getVarIndex(varData).exportNames
+	numDone = 0
+
+	pool = _makePool(varData, maxWorkers) if _shouldUsePool(len(setupList), maxWorkers) else None
+	if pool != None:
+		for matrix in _mapOnPool(pool, _buildMatrixTask, setupList, maxWorkers):
+			# Workers don't send back the (large, shared) column names
+			matrix.colNames = colNames
+			yield matrix
+			numDone += 1
+
+	for setup in setupList[numDone:]:
+		yield proc.buildConstraintMatrix(setup, varData)
+
+
+def countAllConstraints (setupList: List[models.SetupConstraintGroup], varData: models.VarsData, maxWorkers: int = None, keepPool: bool = False) -> List[models.ConstraintCounts]:
+	'''
+	Returns the ConstraintCounts of every setup, in order. Only groups which
+	haven't been counted before get sent to the pool.
+
+	keepPool: Counts on the shared pool (see _getSharedPool), which stays around
+		for the next call, rather than starting and stopping a pool just for this.
+		Only use it from one thread (eg: the GUI's redraws)
+	'''
+	allCounts: List[models.ConstraintCounts] = [proc.getCachedCounts(setup, varData) for setup in setupList]
+	missingInds = [ind for ind, counts in enumerate(allCounts) if counts == None]
+
+	pool = None
+	if _shouldUsePool(len(missingInds), maxWorkers):
+		pool = _getSharedPool(varData, maxWorkers) if keepPool else _makePool(varData, maxWorkers)
+
+	if pool != None:
+		missingSetups = [setupList[ind] for ind in missingInds]
+		numCounted = 0
+		try:
+			for counts in _mapOnPool(pool, _countTask, missingSetups, maxWorkers, keepPool=keepPool):
+				ind = missingInds[numCounted]
+				proc.storeCachedCounts(setupList[ind], varData, counts)
+				allCounts[ind] = counts
+				numCounted += 1
+		finally:
+			# A pool that broke can't be used again, and one with a failed count might
+			# still be busy with cancelled work, so the next call gets a fresh one
+			if keepPool and numCounted < len(missingInds):
+				shutdownSharedPool()
+
+	for ind, counts in enumerate(allCounts):
+		if counts == None:
+			allCounts[ind] = proc.countConstraints(setupList[ind], varData)
+
+	return allCounts
+
+
+def mapWithVarData (task: Callable[..., Any], items: List[Any], varData: models.VarsData, maxWorkers: int = None, taskKwargs: Dict[str, Any] = None) -> Iterator[Any]:
+	'''
+	Yields task(item, varData, **taskKwargs) for every item, in order, spreading
+	the calls across the pool. task has to be a module level function so it can
+	be sent to the workers.
+
+	task and taskKwargs are sent to each worker once, when it starts, rather than
+	with every item, so taskKwargs can hold big things (eg: objective coefficients).
+	'''
+	taskKwargs = taskKwargs or {}
+	numDone = 0
+
+	pool = _makePool(varData, maxWorkers, task, taskKwargs) if _shouldUsePool(len(items), maxWorkers) else None
+	if pool != None:
+		for result in _mapOnPool(pool, _runTask, items, maxWorkers):
+			yield result
+			numDone += 1
+
+	for item in items[numDone:]:
+		yield task(item, varData, **taskKwargs)
+
+
+
+#
+# Pool Setup
+#
+
+def _shouldUsePool (numGroups: int, maxWorkers: int) -> bool:
+	if maxWorkers != None and maxWorkers <= 1:
+		return False
+	if (os.cpu_count() or 1) <= 1:
+		return False
+	return numGroups >= MIN_GROUPS_FOR_POOL
+
+
+def _makePool (varData: models.VarsData, maxWorkers: int, task: Callable[..., Any] = None, taskKwargs: Dict[str, Any] = None) -> concurrent.futures.ProcessPoolExecutor:
+	'''
+	Creates a process pool whose workers are sent the compact variable table (and
+	the task for _runTask) once. Returns None if the pool can't be made.
+	'''
+	encoded = varindex.getEncodedVars(varData)
+
+	try:
+		return concurrent.futures.ProcessPoolExecutor(
+			max_workers=maxWorkers,
+			initializer=_initWorker,
+			initargs=(varData.delim, varData.tag_order, encoded, task, taskKwargs)
+		)
+	except OSError as e:
+		print(f"[[ !! Warning ]] Couldn't make the process pool ({e}), running one at a time")
+		return None
+
+
+def _mapOnPool (pool: concurrent.futures.ProcessPoolExecutor, fn: Callable[[Any], Any], items: List[Any], maxWorkers: int, keepPool: bool = False) -> Iterator[Any]:
+	'''
+	Yields fn(item) for every item, in order, from the pool's workers. The pool is
+	shut down once done, unless keepPool.
+
+	If the workers can't be started, or one of them dies, this stops early (with a
+	warning) and the caller runs the rest itself. Errors raised by fn are passed on.
+
+	Items are sent in chunks, one future each, so stopping early (eg: a cancelled
+	export, or a failed task) can cancel every chunk which hasn't started yet.
+	pool.shutdown(cancel_futures=True) does the same, but only from python 3.9
+	'''
+	chunksize = _getChunksize(len(items), maxWorkers)
+	futures: List[concurrent.futures.Future] = []
+	finished = False
+
+	try:
+		try:
+			for start in range(0, len(items), chunksize):
+				futures.append(pool.submit(_runChunk, fn, items[start:start + chunksize]))
+		except (OSError, BrokenProcessPool) as e:
+			print(f"[[ !! Warning ]] Couldn't start the process pool ({e}), running the rest one at a time")
+			return
+
+		try:
+			for future in futures:
+				for result in future.result():
+					yield result
+		except BrokenProcessPool as e:
+			print(f"[[ !! Warning ]] The process pool stopped working ({e}), running the rest one at a time")
+			return
+
+		finished = True
+	finally:
+		if not finished:
+			# Nobody wants the rest, so don't wait on them. Chunks already handed
+			# to a worker can't be cancelled, they finish in the background
+			for future in futures:
+				future.cancel()
+		if not keepPool:
+			pool.shutdown(wait=finished)
+
+
+def _getChunksize (numGroups: int, maxWorkers: int) -> int:
+	# A few chunks per worker keeps them all busy without too much messaging
+	numWorkers = maxWorkers or os.cpu_count() or 1
+	return max(1, numGroups // (numWorkers * 4))
+
+
+
+# Kept alive between calls by _getSharedPool, along with the
+# (varData version, maxWorkers) it was started for
+_sharedPool: concurrent.futures.ProcessPoolExecutor = None
+_sharedPoolKey: Tuple[int, int] = None
+
+
+def _getSharedPool (varData: models.VarsData, maxWorkers: int) -> concurrent.futures.ProcessPoolExecutor:
+	'''
+	Returns the shared pool, starting it the first time it's asked for. A pool
+	started for another varData object gets shut down and replaced.
+	'''
+	global _sharedPool, _sharedPoolKey
+
+	key = (varindex.getVersionToken(varData), maxWorkers)
+	if _sharedPool != None and _sharedPoolKey == key:
+		return _sharedPool
+
+	shutdownSharedPool()
+	_sharedPool = _makePool(varData, maxWorkers)
+	_sharedPoolKey = key
+
+	return _sharedPool
+
+
+def shutdownSharedPool () -> None:
+	'''
+	Stops the shared pool's workers, if it's running
+	'''
+	global _sharedPool, _sharedPoolKey
+
+	if _sharedPool != None:
+		_sharedPool.shutdown(wait=False)
+
+	_sharedPool = None
+	_sharedPoolKey = None
+
+
+atexit.register(shutdownSharedPool)
+
+
+
+#
+# Worker Side
+#
+
+# Set once per worker process by _initWorker
+_workerVarData: models.VarsData = None
+_workerTask: Callable[..., Any] = None
+_workerTaskKwargs: Dict[str, Any] = None
+
+
+def _initWorker (delim: str, tagOrder: List[str], encoded: models.EncodedVars, task: Callable[..., Any] = None, taskKwargs: Dict[str, Any] = None) -> None:
+	'''
+	Rebuilds the varData object inside a worker, from the compact variable table.
+
+	Variables are the index's own tuples (which share their tag strings) rather
+	than lists, so they aren't stored twice, and the index reuses the codes it was sent.
+	'''
+	global _workerVarData, _workerTask, _workerTaskKwargs
+
+	_workerTask = task
+	_workerTaskKwargs = taskKwargs
+
+	_workerVarData = models.VarsData(
+		delim=delim,
+		tag_order=tagOrder,
+		all_vars=varindex.decodeVarTuples(encoded),
+		tag_members={tagGroup: encoded.tag_tables[ind] for ind, tagGroup in enumerate(tagOrder)}
+	)
+	varindex.getVarIndex(_workerVarData, encoded)
+
+
+def _buildMatrixTask (setup: models.SetupConstraintGroup) -> models.ConstraintMatrix:
+	return proc.buildConstraintMatrix(setup, _workerVarData, withColNames=False)
+
+
+def _countTask (setup: models.SetupConstraintGroup) -> models.ConstraintCounts:
+	return proc.countConstraints(setup, _workerVarData)
+
+
+def _runChunk (fn: Callable[[Any], Any], chunk: List[Any]) -> List[Any]:
+	return [fn(item) for item in chunk]
+
+
+def _runTask (item: Any) -> Any:
+	return _workerTask(item, _workerVarData, **_workerTaskKwargs)
@@ -4,7 +4,8 @@ Processor for (string) Rendering
 This file contains methods for string manipulation and converting data to strings.
 '''
 
-from typing import List
+from typing import Iterable, List
+import itertools
 
 import builder.models as models
 
@@ -86,8 +87,17 @@ def renderConstraintGroup (group: models.ConstraintGroup, delim: str, charwidth:
 	'''
 	Renders a preview for a full constraint group
 	'''
+	return renderEquations(group.equations, delim, charwidth)
+
+
+def renderEquations (eqs: Iterable[models.Equation], delim: str, charwidth:int=-1) -> str:
+	'''
+	Renders a preview from the first few equations. Only those equations get
+	pulled, so passing in a generator (proc_constraints.iterEquations) avoids
+	building the rest of the group.
+	'''
 	NUM_EQS = 5
-	eqs = group.equations[:NUM_EQS]
+	eqs = list(itertools.islice(eqs, NUM_EQS))
 
 	# print(f"In render method. # Eqs: {len(eqs)}, Eqs: {eqs}")
 	# print(f"In render method. # Eqs: {len(eqs)}")
@@ -0,0 +1,203 @@
+'''
+Variable Index
+
+This file builds lookup structures on top of a VarsData object, so
+the constraint builder and exporters never have to scan every variable
+to answer "does this variable exist?" or "which column is it in?".
+
+An index is built the first time it is asked for and then reused for
+as long as the VarsData object is alive.
+'''
+
+import itertools
+import weakref
+from array import array
+from typing import Dict, List, Tuple
+
+import attrs
+
+import builder.models as models
+import builder.proc_bitset as bitset
+
+
+
+@attrs.define
+class VarIndex:
+	'''
+	Lookup tables generated from a VarsData object. Variables are stored
+	as tuples of their tags so they can be hashed.
+
+	Variables are also referred to by id, which is their position in all_vars.
+
+	The tables keyed by whole variables (varIds, exportOrder, exportCol and
+	exportNames) take up the most room, so they're only built the first time
+	they're used. Pool workers which never export don't pay for them.
+
+	version: A number unique to this index (and so to its varData object). Lets
+		caches tell apart results built from different varData objects
+	delim: The varData's delimiter, for exportNames
+	encoded: The integer-encoded variables (see models.EncodedVars)
+	tagCodes: For each tag group (in tag_order), a dictionary between a tag and its code
+	varTuples: Every variable, by id
+	varIds: Dictionary between every variable and its id, for O(1) existence checks
+	exportOrder: Variables in the order they appear as columns in exported files
+	exportCol: Dictionary between a variable and its position in exportOrder
+	exportNames: Full variable names (tags joined by delim), in exportOrder
+	tagPostings: For each tag group, a dictionary between a tag's code and the ids
+		of every variable that has that tag (in increasing order)
+	tagBitsets: Same as tagPostings, but as bitsets (see proc_bitset). These are
+		filled in as they're asked for, use getTagBitset()
+
+	== Example
+	all_vars = [ ['167N', 'PLSQ', '2021'], ['167N', 'THNB', '2021'] ]
+
+	varIds = { ('167N', 'PLSQ', '2021'): 0, ('167N', 'THNB', '2021'): 1 }
+	exportOrder = [ ('167N', 'PLSQ', '2021'), ('167N', 'THNB', '2021') ]
+	exportCol = {
+		('167N', 'PLSQ', '2021'): 0,
+		('167N', 'THNB', '2021'): 1
+	}
+	exportNames = [ '167N_PLSQ_2021', '167N_THNB_2021' ]
+	tagCodes = [ {'167N': 0}, {'PLSQ': 0, 'THNB': 1}, {'2021': 0} ]
+	tagPostings = {
+		'for_type': { 0: array('L', [0, 1]) },
+		'mng': { 0: array('L', [0]), 1: array('L', [1]) },
+		'year': { 0: array('L', [0, 1]) }
+	}
+	'''
+	version: int
+	delim: str
+	encoded: models.EncodedVars
+	tagCodes: List[Dict[str, int]]
+	varTuples: List[Tuple[str, ...]]
+	tagPostings: Dict[str, Dict[int, array]]
+	tagBitsets: Dict[str, Dict[int, int]]
+
+	_varIds: Dict[Tuple[str, ...], int] = attrs.field(default=None, init=False, repr=False)
+	_exportOrder: List[Tuple[str, ...]] = attrs.field(default=None, init=False, repr=False)
+	_exportCol: Dict[Tuple[str, ...], int] = attrs.field(default=None, init=False, repr=False)
+	_exportNames: List[str] = attrs.field(default=None, init=False, repr=False)
+
+	@property
+	def varIds (self) -> Dict[Tuple[str, ...], int]:
+		if self._varIds == None:
+			self._varIds = {tags: varId for varId, tags in enumerate(self.varTuples)}
+		return self._varIds
+
+	@property
+	def exportOrder (self) -> List[Tuple[str, ...]]:
+		# Exported files order columns by the concatenated tags
+		if self._exportOrder == None:
+			self._exportOrder = sorted(self.varTuples, key=lambda tags: "".join(tags))
+		return self._exportOrder
+
+	@property
+	def exportCol (self) -> Dict[Tuple[str, ...], int]:
+		if self._exportCol == None:
+			self._exportCol = {tags: col for col, tags in enumerate(self.exportOrder)}
+		return self._exportCol
+
+	@property
+	def exportNames (self) -> List[str]:
+		if self._exportNames == None:
+			self._exportNames = [self.delim.join(tags) for tags in self.exportOrder]
+		return self._exportNames
+
+	def hasVar (self, tags) -> bool:
+		return tuple(tags) in self.varIds
+
+	def getTagBitset (self, tagGroup: str, code: int) -> int:
+		'''
+		Returns the bitset of every variable with the tag, building it on first use
+		'''
+		groupBitsets = self.tagBitsets[tagGroup]
+		if code not in groupBitsets:
+			posting = self.tagPostings[tagGroup].get(code, [])
+			groupBitsets[code] = bitset.fromIds(posting, self.encoded.numVars())
+
+		return groupBitsets[code]
+
+
+def buildVarIndex (varData: models.VarsData, encoded: models.EncodedVars = None) -> VarIndex:
+	'''
+	Builds a fresh index for the varData object. Prefer getVarIndex(),
+	which only builds the index once per varData object.
+
+	encoded: The varData's variables already encoded (eg: by proc_ingest), so
+		they don't have to be encoded again
+	'''
+	allVars = [tuple(tags) for tags in varData.all_vars]
+
+	if encoded == None:
+		encoded = models.EncodedVars.fromVarsData(varData)
+
+	tagPostings = {}
+	for g, tagGroup in enumerate(varData.tag_order):
+		postings = {}
+		for varId, code in enumerate(encoded.codes[g]):
+			if code not in postings:
+				postings[code] = array('L')
+			postings[code].append(varId)
+		tagPostings[tagGroup] = postings
+
+	tagCodes = []
+	for table in encoded.tag_tables:
+		tagCodes.append({tag: code for code, tag in enumerate(table)})
+
+	return VarIndex(
+		version=next(_versionCounter),
+		delim=varData.delim,
+		encoded=encoded,
+		tagCodes=tagCodes,
+		varTuples=allVars,
+		tagPostings=tagPostings,
+		tagBitsets={tagGroup: {} for tagGroup in varData.tag_order}
+	)
+
+
+
+def decodeVarTuples (encoded: models.EncodedVars) -> List[Tuple[str, ...]]:
+	'''
+	Rebuilds every variable, as a tuple of its tags, from the encoded variables.
+	Variables share the tag strings from the tag tables rather than having their own.
+	'''
+	columns = [[table[code] for code in groupCol] for table, groupCol in zip(encoded.tag_tables, encoded.codes)]
+	return list(zip(*columns))
+
+
+
+_versionCounter = itertools.count()
+
+# VarsData is not hashable (it holds lists), so the cache is keyed by id.
+# Entries are dropped when their VarsData gets garbage collected.
+_indexCache: Dict[int, VarIndex] = {}
+
+def getVarIndex (varData: models.VarsData, encoded: models.EncodedVars = None) -> VarIndex:
+	'''
+	Returns the index for the varData object, building it on first use.
+	encoded is only used when building, see buildVarIndex.
+	'''
+	key = id(varData)
+	index = _indexCache.get(key)
+
+	if index == None:
+		index = buildVarIndex(varData, encoded)
+		_indexCache[key] = index
+		weakref.finalize(varData, _indexCache.pop, key, None)
+
+	return index
+
+
+def getVersionToken (varData: models.VarsData) -> int:
+	'''
+	Returns a token which is different for every varData object
+	'''
+	return getVarIndex(varData).version
+
+
+def getEncodedVars (varData: models.VarsData) -> models.EncodedVars:
+	'''
+	Returns the integer-encoded form of the varData object's variables,
+	which lives alongside its all_vars.
+	'''
+	return getVarIndex(varData).encoded